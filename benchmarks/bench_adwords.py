@@ -0,0 +1,336 @@
+"""
+End to end benchmarks of AdwordsUtility against the in-process fake backend, results are written as JSON so runs can
+be compared over time.
+
+Suites:
+
+    report: get_report rows/sec streaming, spooled, in chunk_days windows and cleaned on processes, with stage timings
+    pages: get_service entries/sec for serialize True, 'lazy' and False, sequential and with parallel_pages
+    accounts: get_all_account_info seconds as the number of accounts grows
+    files: writing a report with write_csv and write_columnar, and loading it back from each
+    load: inserting a report into sqlite3 row at a time (committing every row or once) vs load_report batches
+    services: many small API calls building a service per call vs reusing cached services
+
+Usage:
+
+    python -m benchmarks.bench_adwords --output results.json
+    python -m benchmarks.bench_adwords --suite report --rows 200000 --latency 0.2 --bandwidth 20000000
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+import unicodecsv as csv
+
+import easyadwords
+from easyadwords import AdwordsUtility
+from easyadwords.instrumentation import InMemoryCollector
+from easyadwords.loaders import load_report, insert_statement
+from easyadwords.writers import write_csv, write_columnar, read_columnar
+
+from benchmarks.fake_adwords import FakeAdWordsClient
+
+REPORT_FIELDS = [
+    {'name': 'Date'},
+    {'name': 'CampaignId'},
+    {'name': 'CampaignName'},
+    {'name': 'Cost'},
+    {'name': 'Impressions'},
+    {'name': 'Clicks'},
+    {'name': 'Conversions'},
+    {'name': 'Ctr'},
+    {'name': 'Labels'}
+]
+
+START_DATE = datetime(2016, 9, 1)
+END_DATE = datetime(2016, 9, 28)
+
+
+def new_utility(**kwargs):
+    collector = InMemoryCollector()
+    client = FakeAdWordsClient(**kwargs)
+    return AdwordsUtility(None, client=client, instrumentation=collector), client, collector
+
+
+def timed(f):
+    started = time.time()
+    result = f()
+    return result, time.time() - started
+
+
+def bench_report(args):
+    modes = [
+        ('stream', {}),
+        ('spool', {'spool': True}),
+        ('chunk_days=7', {'chunk_days': 7, 'max_workers': 4}),
+        ('processes=4', {'processes': 4})
+    ]
+
+    results = []
+    for mode, kwargs in modes:
+        utility, client, collector = new_utility(rows=args.rows, latency=args.latency, bandwidth=args.bandwidth)
+
+        def run():
+            report = utility.get_report(
+                START_DATE, END_DATE, 'CAMPAIGN_PERFORMANCE_REPORT', [dict(x) for x in REPORT_FIELDS], **kwargs
+            )
+            return sum(1 for _ in report) - 1
+
+        # build report bodies and warm the report fields cache outside the timed run
+        run()
+        collector.reset()
+
+        rows, seconds = timed(run)
+
+        snapshot = collector.snapshot()
+        results.append({
+            'benchmark': 'report',
+            'params': dict(mode=mode, rows=args.rows, latency=args.latency, bandwidth=args.bandwidth),
+            'seconds': seconds,
+            'rows': rows,
+            'rows_per_second': rows / seconds,
+            'bytes_downloaded': snapshot['counters'].get('report.bytes_downloaded'),
+            'stages': {k: v['total'] for k, v in snapshot['timings'].iteritems()}
+        })
+
+    return results
+
+
+def bench_pages(args):
+    results = []
+    for serialize in (True, 'lazy', False):
+        for parallel_pages in (None, 4):
+            utility, client, collector = new_utility(entities=args.entities, page_latency=args.page_latency)
+            client.service_entries('AdGroupCriterionService')
+
+            selector = {'fields': ['Id', 'CriteriaType', 'KeywordText'], 'paging': {'startIndex': '0'}}
+
+            entries, seconds = timed(lambda: len(utility.get_service(
+                'AdGroupCriterionService',
+                selector,
+                serialize=serialize,
+                page_size=args.page_size,
+                parallel_pages=parallel_pages
+            )))
+
+            snapshot = collector.snapshot()
+            results.append({
+                'benchmark': 'pages',
+                'params': dict(
+                    serialize=serialize,
+                    parallel_pages=parallel_pages,
+                    entities=args.entities,
+                    page_size=args.page_size,
+                    page_latency=args.page_latency
+                ),
+                'seconds': seconds,
+                'entries': entries,
+                'entries_per_second': entries / seconds,
+                'pages': snapshot['counters'].get('service.pages')
+            })
+
+    return results
+
+
+def bench_accounts(args):
+    results = []
+    for accounts in args.accounts:
+        # one row per account and day
+        utility, client, collector = new_utility(
+            rows=(END_DATE - START_DATE).days + 1,
+            entities=accounts,
+            latency=args.latency
+        )
+        client.service_entries('ManagedCustomerService')
+
+        lookup, seconds = timed(
+            lambda: utility.get_all_account_info(START_DATE, END_DATE, max_workers=args.max_workers)
+        )
+
+        results.append({
+            'benchmark': 'accounts',
+            'params': dict(accounts=accounts, max_workers=args.max_workers, latency=args.latency),
+            'seconds': seconds,
+            'accounts_per_second': accounts / seconds,
+            'report_downloads': client.counters.get('report_downloads'),
+            'accounts_found': len(lookup)
+        })
+
+    return results
+
+
+def bench_services(args):
+    results = []
+    for cache_services in (False, True):
+        client = FakeAdWordsClient(setup_latency=args.setup_latency)
+        utility = AdwordsUtility(None, client=client, cache_services=cache_services)
+
+        def run():
+            for _ in xrange(args.calls):
+                utility.get_report_fields('CAMPAIGN_PERFORMANCE_REPORT', refresh=True)
+
+        _, seconds = timed(run)
+
+        results.append({
+            'benchmark': 'services',
+            'params': dict(cache_services=cache_services, calls=args.calls, setup_latency=args.setup_latency),
+            'seconds': seconds,
+            'calls_per_second': args.calls / seconds,
+            'services_built': client.counters.get('services')
+        })
+
+    return results
+
+
+def bench_files(args):
+    utility, client, collector = new_utility(rows=args.rows)
+
+    fields = [dict(x) for x in REPORT_FIELDS]
+    rows = list(utility.get_report(START_DATE, END_DATE, 'CAMPAIGN_PERFORMANCE_REPORT', fields))
+
+    directory = tempfile.mkdtemp()
+    try:
+        csv_path = os.path.join(directory, 'report.csv')
+        columnar_path = os.path.join(directory, 'report.col')
+
+        _, write_csv_seconds = timed(lambda: write_csv(iter(rows), csv_path))
+        _, write_columnar_seconds = timed(lambda: write_columnar(iter(rows), columnar_path, fields))
+
+        def read_csv():
+            with open(csv_path, 'rb') as f:
+                return list(csv.reader(f))
+
+        _, read_csv_seconds = timed(read_csv)
+        _, read_columnar_seconds = timed(lambda: read_columnar(columnar_path))
+
+        return [{
+            'benchmark': 'files',
+            'params': dict(rows=args.rows),
+            'seconds': read_columnar_seconds,
+            'write_csv_seconds': write_csv_seconds,
+            'write_columnar_seconds': write_columnar_seconds,
+            'read_csv_seconds': read_csv_seconds,
+            'read_columnar_seconds': read_columnar_seconds,
+            'csv_bytes': os.path.getsize(csv_path),
+            'columnar_bytes': os.path.getsize(columnar_path)
+        }]
+    finally:
+        shutil.rmtree(directory)
+
+
+def bench_load(args):
+    fields = [dict(x) for x in REPORT_FIELDS]
+
+    def run(mode, source, latency=0.0, bandwidth=None):
+        utility, client, collector = new_utility(rows=args.rows, latency=latency, bandwidth=bandwidth)
+
+        # build report body and warm the report fields cache outside the timed run
+        rows = list(utility.get_report(START_DATE, END_DATE, 'CAMPAIGN_PERFORMANCE_REPORT', fields))
+
+        directory = tempfile.mkdtemp()
+        try:
+            connection = sqlite3.connect(os.path.join(directory, 'bench.db'))
+            connection.execute('CREATE TABLE report (%s)' % ', '.join(rows[0]))
+
+            def load():
+                if source == 'download':
+                    report = utility.get_report(START_DATE, END_DATE, 'CAMPAIGN_PERFORMANCE_REPORT', fields)
+                else:
+                    report = iter(rows)
+
+                if mode in ('row', 'row_commit'):
+                    statement = insert_statement('report', next(report))
+                    cursor = connection.cursor()
+                    for row in report:
+                        cursor.execute(statement, row)
+                        if mode == 'row_commit':
+                            connection.commit()
+                    connection.commit()
+                else:
+                    load_report(report, connection, 'report', pipeline=mode == 'pipeline')
+
+            _, seconds = timed(load)
+            count = connection.execute('SELECT COUNT(*) FROM report').fetchone()[0]
+            connection.close()
+        finally:
+            shutil.rmtree(directory)
+
+        return {
+            'benchmark': 'load',
+            'params': dict(mode=mode, source=source, rows=args.rows, latency=latency, bandwidth=bandwidth),
+            'seconds': seconds,
+            'rows': count,
+            'rows_per_second': count / seconds
+        }
+
+    # inserts alone from rows in memory, then end to end where pipelining overlaps a slow download with inserts
+    bandwidth = args.bandwidth or 1024 * 1024
+    return [
+        run('row_commit', 'memory'),
+        run('row', 'memory'),
+        run('batch', 'memory'),
+        run('row', 'download', args.latency, bandwidth),
+        run('batch', 'download', args.latency, bandwidth),
+        run('pipeline', 'download', args.latency, bandwidth)
+    ]
+
+
+SUITES = [
+    ('report', bench_report),
+    ('pages', bench_pages),
+    ('accounts', bench_accounts),
+    ('files', bench_files),
+    ('load', bench_load),
+    ('services', bench_services)
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--suite', action='append', choices=[x[0] for x in SUITES], help='Run only this suite.')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file results are written to.')
+    parser.add_argument('--rows', type=int, default=100000, help='Rows per report.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds before each report starts streaming.')
+    parser.add_argument('--bandwidth', type=int, default=None, help='Report download bytes per second.')
+    parser.add_argument('--entities', type=int, default=20000, help='Entries returned by get_service.')
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--page-latency', type=float, default=0.01, help='Seconds per get_service page.')
+    parser.add_argument('--accounts', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--max-workers', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=200, help='API calls of the services suite.')
+    parser.add_argument('--setup-latency', type=float, default=0.05, help='Seconds to build a service.')
+    args = parser.parse_args()
+
+    results = []
+    for name, suite in SUITES:
+        if args.suite and name not in args.suite:
+            continue
+
+        for result in suite(args):
+            print '%-10s %-110s %8.3fs' % (
+                result['benchmark'],
+                json.dumps(result['params'], sort_keys=True),
+                result['seconds']
+            )
+            results.append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created_at': datetime.now().isoformat(),
+            'easyadwords_version': easyadwords.__version__,
+            'python_version': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results
+        }, f, indent=2, sort_keys=True)
+
+    print 'results written to %s' % args.output
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Rows/sec of report row cleaning: the previous per-cell _default_cleaner dispatch vs the compiled RowCleaner.
+
+Usage:
+
+    python benchmarks/bench_cleaning.py --rows 2000000
+"""
+import argparse
+import itertools
+import random
+import re
+import time
+from ast import literal_eval
+from datetime import datetime, timedelta
+
+from easyadwords.cleaning import RowCleaner
+
+FIELDS = [
+    {'name': 'Date', 'alias': 'date', 'type': 'Date'},
+    {'name': 'ExternalCustomerId', 'alias': 'account_id', 'type': 'Long'},
+    {'name': 'CampaignName', 'alias': 'campaign', 'type': 'String'},
+    {'name': 'Labels', 'alias': 'labels', 'type': 'List'},
+    {'name': 'Cost', 'alias': 'cost', 'type': 'Money'},
+    {'name': 'Impressions', 'alias': 'impressions', 'type': 'Long'},
+    {'name': 'Clicks', 'alias': 'clicks', 'type': 'Long'},
+    {'name': 'Conversions', 'alias': 'conversions', 'type': 'Double'},
+    {'name': 'Ctr', 'alias': 'ctr', 'type': 'Double'},
+]
+
+ADDITIONAL_FIELDS = [
+    {'name': 'updated_at', 'value': datetime(2016, 9, 1), 'prepend': True},
+    {'name': 'source', 'value': 'adwords'},
+]
+
+
+def _default_cleaner(field_value, field_type):
+    field_value = field_value.strip()
+
+    if field_value == '--':
+        return None
+
+    elif 'List' in field_type:
+        if field_value is None or field_value == '':
+            return None
+        else:
+            return ';'.join(literal_eval(field_value))
+
+    elif field_type == 'Money':
+        return round(float(re.sub(r'[^\d\-.]+', '', field_value)) / 1000000.0, 6)
+
+    elif field_type == 'Date':
+        return datetime.strptime(field_value, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S')
+
+    elif field_type == 'Double':
+        return float(re.sub(r'[^\d\-.]+', '', field_value))
+
+    elif field_type in ('Long', 'Integer'):
+        return int(float(re.sub(r'[^\d\-.]+', '', field_value)))
+
+    else:
+        return field_value
+
+
+def legacy_clean_rows(rows, fields, additional_fields):
+    for row in rows:
+        cleaned_row = []
+        for index, field_config in enumerate(fields):
+            if 'cleaning' in field_config:
+                cleaned_value = field_config['cleaning'](row[index])
+            else:
+                cleaned_value = _default_cleaner(row[index], field_config['type'])
+
+            cleaned_row.append(cleaned_value)
+
+        for additional_field in additional_fields:
+            if additional_field.get('prepend', None) is True:
+                cleaned_row.insert(0, additional_field['value'])
+            else:
+                cleaned_row.append(additional_field['value'])
+
+        yield cleaned_row
+
+
+def synthetic_rows(pool_size=10000, seed=0):
+    rand = random.Random(seed)
+    start = datetime(2016, 1, 1)
+
+    pool = []
+    for i in range(pool_size):
+        pool.append([
+            (start + timedelta(i % 365)).strftime('%Y-%m-%d'),
+            str(rand.randint(10 ** 9, 10 ** 10)),
+            'Campaign %d' % (i % 500),
+            '["label a", "label b"]' if i % 10 == 0 else '--',
+            str(rand.randint(0, 10 ** 9)),
+            str(rand.randint(0, 10 ** 5)),
+            str(rand.randint(0, 10 ** 3)),
+            '%.2f' % (rand.random() * 100),
+            '%.2f%%' % (rand.random() * 100),
+        ])
+
+    return pool
+
+
+def run(name, clean_rows, pool, rows):
+    started = time.time()
+    for _ in clean_rows(itertools.islice(itertools.cycle(pool), rows)):
+        pass
+    elapsed = time.time() - started
+
+    print '%-12s %10d rows %8.2fs %12.0f rows/sec' % (name, rows, elapsed, rows / elapsed)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000000)
+    args = parser.parse_args()
+
+    pool = synthetic_rows()
+
+    # sanity check, both implementations must agree
+    cleaner = RowCleaner(FIELDS, ADDITIONAL_FIELDS)
+    assert list(cleaner.clean_rows(pool)) == list(legacy_clean_rows(pool, FIELDS, ADDITIONAL_FIELDS))
+
+    before = run('before', lambda rows: legacy_clean_rows(rows, FIELDS, ADDITIONAL_FIELDS), pool, args.rows)
+    after = run('after', RowCleaner(FIELDS, ADDITIONAL_FIELDS).clean_rows, pool, args.rows)
+
+    print 'speedup      %.2fx' % (before / after)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Cost of serializing a synthetic get_service response: the previous asdict based serialize_soap_resp vs the current
+one and LazyRecord views.
+
+Usage:
+
+    python benchmarks/bench_serialize.py --entities 100000
+"""
+import argparse
+import time
+
+from suds.sudsobject import Factory, asdict
+
+from easyadwords.utils import serialize_soap_resp, LazyRecord
+
+
+def legacy_serialize_soap_resp(resp):
+    out = {}
+    for k, v in asdict(resp).iteritems():
+        if hasattr(v, '__keylist__'):
+            out[k] = legacy_serialize_soap_resp(v)
+        elif isinstance(v, list):
+            out[k] = []
+            for item in v:
+                if hasattr(item, '__keylist__'):
+                    out[k].append(legacy_serialize_soap_resp(item))
+                else:
+                    out[k].append(item)
+        else:
+            try:
+                out[k] = v.encode('utf-8')
+            except AttributeError:
+                out[k] = v
+
+    return out
+
+
+def synthetic_entities(count):
+    """
+    Keyword criteria shaped like AdGroupCriterionService entries.
+    """
+
+    entities = []
+    for i in range(count):
+        entities.append(Factory.object('BiddableAdGroupCriterion', {
+            'adGroupId': 1000 + i % 50,
+            'criterionUse': u'BIDDABLE',
+            'userStatus': u'ENABLED',
+            'systemServingStatus': u'ELIGIBLE',
+            'criterion': Factory.object('Keyword', {
+                'id': i,
+                'type': u'KEYWORD',
+                'text': u'keyword %d' % i,
+                'matchType': u'BROAD',
+            }),
+            'labels': [Factory.object('Label', {'id': i % 7, 'name': u'label %d' % (i % 7)})],
+            'finalUrls': Factory.object('UrlList', {'urls': [u'http://example.com/%d' % i]}),
+            'biddingStrategyConfiguration': Factory.object('BiddingStrategyConfiguration', {
+                'biddingStrategyType': u'MANUAL_CPC',
+                'bids': [Factory.object('CpcBid', {
+                    'bid': Factory.object('Money', {'microAmount': 1000000 + i}),
+                    'cpcBidSource': u'ADGROUP',
+                })],
+            }),
+        }))
+
+    return entities
+
+
+def run(name, serialize, entities):
+    started = time.time()
+    for entity in entities:
+        serialize(entity)
+    elapsed = time.time() - started
+
+    print '%-24s %8d entities %8.2fs %12.0f entities/sec' % (name, len(entities), elapsed, len(entities) / elapsed)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entities', type=int, default=100000)
+    args = parser.parse_args()
+
+    entities = synthetic_entities(args.entities)
+
+    # sanity check, both implementations must agree
+    assert all(serialize_soap_resp(x) == legacy_serialize_soap_resp(x) for x in entities[:1000])
+    assert all(LazyRecord(x).to_dict() == serialize_soap_resp(x) for x in entities[:1000])
+
+    before = run('before', legacy_serialize_soap_resp, entities)
+    after = run('after', serialize_soap_resp, entities)
+    lazy = run('lazy, one nested field', lambda x: LazyRecord(x).criterion.text, entities)
+
+    print 'speedup                  %.2fx' % (before / after)
+    print 'speedup lazy             %.2fx' % (before / lazy)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+In-process stand-in for googleads AdWordsClient, serving synthetic reports and service pages without network access.
+
+    client = FakeAdWordsClient(rows=100000, latency=0.5, bandwidth=10 * 1024 * 1024)
+    utility = AdwordsUtility(None, client=client)
+"""
+import gzip
+import io
+import random
+import time
+from datetime import datetime, timedelta
+from threading import Lock
+
+from suds.sudsobject import Factory
+
+
+# fieldType per field name returned by getReportFields, fields not listed are String
+REPORT_FIELDS = [
+    ('Date', 'Date'),
+    ('ExternalCustomerId', 'Long'),
+    ('AccountDescriptiveName', 'String'),
+    ('CampaignId', 'Long'),
+    ('CampaignName', 'String'),
+    ('AdGroupId', 'Long'),
+    ('Cost', 'Money'),
+    ('AverageCpc', 'Money'),
+    ('Impressions', 'Long'),
+    ('Clicks', 'Long'),
+    ('Conversions', 'Double'),
+    ('Ctr', 'Double'),
+    ('Labels', 'List'),
+]
+
+
+def _value(field_name, field_type, date, customer_id, index, rnd):
+    if field_name == 'ExternalCustomerId':
+        return customer_id
+    if field_type == 'Date':
+        return date.strftime('%Y-%m-%d')
+    if field_type == 'Money':
+        return str(rnd.randint(0, 10 ** 9))
+    if field_type in ('Long', 'Integer'):
+        return str(rnd.randint(0, 100000))
+    if field_type == 'Double':
+        return '%.2f%%' % (rnd.random() * 100) if field_name == 'Ctr' else '%.2f' % (rnd.random() * 10)
+    if field_type == 'List':
+        return '["label %d", "label %d"]' % (index % 7, index % 11)
+    return '%s %d, "%d"' % (field_name, index % 1000, index % 13)
+
+
+def _csv_line(values):
+    return ','.join('"%s"' % x.replace('"', '""') if ',' in x or '"' in x else x for x in values) + '\n'
+
+
+def synthetic_report(report, customer_id, rows, field_types, seed=0):
+    """
+    Build a GZIPPED_CSV report body without headers or summary, as DownloadReportAsStream returns it.
+
+    :param report: Report definition passed to DownloadReportAsStream.
+    :param customer_id: Value of ExternalCustomerId.
+    :param rows: Number of rows, spread evenly over the days of the report's date range.
+    :param field_types: Dictionary of field name to fieldType.
+    :return: gzipped bytes
+    """
+
+    rnd = random.Random(seed)
+    fields = [(x, field_types.get(x, 'String')) for x in report['selector']['fields']]
+
+    start = datetime.strptime(report['selector']['dateRange']['min'], '%Y%m%d')
+    days = (datetime.strptime(report['selector']['dateRange']['max'], '%Y%m%d') - start).days + 1
+
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        for index in xrange(rows):
+            date = start + timedelta(index * days // max(rows, 1))
+            f.write(_csv_line([_value(name, field_type, date, customer_id, index, rnd) for name, field_type in fields]))
+
+    return out.getvalue()
+
+
+class FakeStream(object):
+    """
+    Report download stream, read at most bandwidth bytes per second.
+    """
+
+    def __init__(self, data, bandwidth=None):
+        self._data = io.BytesIO(data)
+        self._bandwidth = bandwidth
+
+    def read(self, size=-1):
+        data = self._data.read(size)
+        if self._bandwidth:
+            time.sleep(len(data) / float(self._bandwidth))
+        return data
+
+    def close(self):
+        pass
+
+
+class FakeReportDownloader(object):
+    def __init__(self, client):
+        self._client = client
+
+    def DownloadReportAsStream(self, report, client_customer_id=None, **kwargs):
+        client = self._client
+        customer_id = str(client_customer_id or client.client_customer_id).replace('-', '')
+
+        client.count('report_downloads')
+        if client.latency:
+            time.sleep(client.latency)
+
+        return FakeStream(client.report_body(report, customer_id), client.bandwidth)
+
+
+class FakeService(object):
+    def __init__(self, client, service_name):
+        self._client = client
+        self._service_name = service_name
+
+    def getReportFields(self, report_type):
+        self._client.count('operations')
+
+        return [
+            Factory.object('ReportDefinitionField', {
+                'fieldName': name,
+                'displayFieldName': name,
+                'xmlAttributeName': name[0].lower() + name[1:],
+                'fieldType': field_type,
+                'canSelect': True,
+                'canFilter': True
+            })
+            for name, field_type in self._client.report_fields
+        ]
+
+    def get(self, selector):
+        client = self._client
+
+        client.count('operations')
+        if client.page_latency:
+            time.sleep(client.page_latency)
+
+        start = int(selector['paging']['startIndex'])
+        end = min(client.entities, start + int(selector['paging']['numberResults']))
+
+        page = {'totalNumEntries': client.entities}
+        if start < end:
+            page['entries'] = client.service_entries(self._service_name)[start:end]
+
+        return Factory.object('Page', page)
+
+
+class FakeOAuth2Client(object):
+    def CreateHttpHeader(self):
+        return {'Authorization': 'Bearer fake'}
+
+    def Refresh(self):
+        pass
+
+
+class FakeAdWordsClient(object):
+    """
+    Stand-in for AdWordsClient. Copies made by ClientPool share report bodies and call counters.
+    """
+
+    def __init__(self, rows=1000, report_fields=None, latency=0.0, bandwidth=None, entities=1000, page_latency=0.0,
+                 client_customer_id='123-456-7890', seed=0, setup_latency=0.0):
+        """
+        :param rows: Rows per report download.
+        :param report_fields: List of (fieldName, fieldType), defaults to REPORT_FIELDS.
+        :param latency: Seconds before a report download starts streaming.
+        :param bandwidth: If set, report downloads stream at this many bytes per second.
+        :param entities: Total entries returned by get_service, ManagedCustomerService entries are accounts.
+        :param page_latency: Seconds per get_service page.
+        :param client_customer_id: Default customer.
+        :param seed: Seed of synthetic values.
+        :param setup_latency: Seconds to build a service or report downloader, ie. WSDL/XSD setup.
+        """
+
+        self.rows = rows
+        self.report_fields = REPORT_FIELDS if report_fields is None else report_fields
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.entities = entities
+        self.page_latency = page_latency
+        self.client_customer_id = client_customer_id
+        self.seed = seed
+        self.setup_latency = setup_latency
+
+        self.developer_token = 'fake-developer-token'
+        self.oauth2_client = FakeOAuth2Client()
+        self.proxy_config = None
+
+        self.counters = {}
+        self._bodies = {}
+        self._entries = {}
+        self._lock = Lock()
+
+    def SetClientCustomerId(self, client_customer_id):
+        self.client_customer_id = client_customer_id
+
+    def _setup(self):
+        self.count('services')
+        if self.setup_latency:
+            time.sleep(self.setup_latency)
+
+    def GetReportDownloader(self, version=None, server=None):
+        self._setup()
+        return FakeReportDownloader(self)
+
+    def GetService(self, service_name, version=None, server=None):
+        self._setup()
+        return FakeService(self, service_name)
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def report_body(self, report, customer_id):
+        """
+        Synthetic report body, generated once per definition and customer so benchmarks do not time the fake.
+        """
+
+        selector = report['selector']
+        key = (customer_id, tuple(selector['fields']), selector['dateRange']['min'], selector['dateRange']['max'])
+
+        with self._lock:
+            body = self._bodies.get(key)
+
+        if body is None:
+            body = synthetic_report(report, customer_id, self.rows, dict(self.report_fields), self.seed)
+            with self._lock:
+                self._bodies[key] = body
+
+        return body
+
+    def service_entries(self, service_name):
+        """
+        Synthetic entries of a service, built once so benchmarks do not time the fake. ManagedCustomerService entries
+        are accounts, other services return keyword criteria.
+        """
+
+        entity = self.account if service_name == 'ManagedCustomerService' else self.criterion
+
+        with self._lock:
+            entries = self._entries.get(entity.__name__)
+            if entries is None:
+                entries = self._entries[entity.__name__] = [entity(i) for i in xrange(self.entities)]
+
+        return entries
+
+    def account(self, index):
+        return Factory.object('ManagedCustomer', {
+            'name': u'Account %d' % index,
+            'customerId': 1000000000 + index,
+            'canManageClients': False,
+            'currencyCode': u'USD',
+            'dateTimeZone': u'America/New_York',
+            'accountLabels': [Factory.object('AccountLabel', {'id': index % 5, 'name': u'label %d' % (index % 5)})]
+        })
+
+    def criterion(self, index):
+        return Factory.object('BiddableAdGroupCriterion', {
+            'adGroupId': 1000 + index % 50,
+            'criterionUse': u'BIDDABLE',
+            'userStatus': u'ENABLED',
+            'criterion': Factory.object('Keyword', {
+                'id': index,
+                'type': u'KEYWORD',
+                'text': u'keyword %d' % index,
+                'matchType': u'BROAD'
+            }),
+            'labels': [Factory.object('Label', {'id': index % 7, 'name': u'label %d' % (index % 7)})],
+            'biddingStrategyConfiguration': Factory.object('BiddingStrategyConfiguration', {
+                'biddingStrategyType': u'MANUAL_CPC',
+                'bids': [Factory.object('CpcBid', {'bid': Factory.object('Money', {'microAmount': 1000000 + index})})]
+            })
+        })
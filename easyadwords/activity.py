@@ -0,0 +1,287 @@
+from array import array
+from datetime import datetime
+from itertools import izip
+
+from easyadwords.columnar import np
+from easyadwords.hierarchy import normalize_customer_id
+from easyadwords.writers import ColumnarWriter, ColumnarFile
+
+# column name, array typecode and Adwords type of each parallel array
+_COLUMNS = (
+    ('account_id', 'l', 'Long'),
+    ('date', 'l', 'Long'),
+    ('cost', 'd', 'Money'),
+    ('impressions', 'l', 'Long'),
+    ('clicks', 'l', 'Long'),
+    ('conversions', 'd', 'Double')
+)
+
+METRICS = ('cost', 'impressions', 'clicks', 'conversions')
+
+
+def _to_ordinal(value):
+    if isinstance(value, basestring):
+        value = datetime.strptime(value[:10], '%Y-%m-%d')
+    return value.toordinal()
+
+
+class AccountActivityIndex(object):
+    """
+    Daily account metrics (cost, impressions, clicks, conversions) held in parallel typed arrays, one entry per account
+    and day, with dates stored as ordinals.
+
+    Queries are vectorized with numpy when it is installed and fall back to plain loops otherwise.
+    """
+
+    def __init__(self, columns=None):
+        """
+        :param columns: Existing arrays per column name, else the index starts empty.
+        """
+
+        if columns is None:
+            columns = {name: array(typecode) for name, typecode, _ in _COLUMNS}
+
+        self._columns = columns
+
+    def __len__(self):
+        return len(self._columns['date'])
+
+    @classmethod
+    def from_reports(cls, reports):
+        """
+        Build index from get_reports output of the ACCOUNT_PERFORMANCE_REPORT fields used by get_all_account_info.
+
+        :param reports: Iterable of (client_customer_id, rows), rows header first.
+        :return: AccountActivityIndex
+        """
+
+        index = cls()
+        index.update(reports)
+        return index
+
+    def _append_rows(self, header, rows, dates):
+        positions = [header.index(name) for name, _, _ in _COLUMNS]
+        appends = [self._columns[name].append for name, _, _ in _COLUMNS]
+
+        for row in rows:
+            row = [row[i] for i in positions]
+
+            # reports only hold a handful of distinct dates
+            date = row[1]
+            try:
+                row[1] = dates[date]
+            except KeyError:
+                row[1] = dates[date] = _to_ordinal(date)
+
+            for append, value in zip(appends, row):
+                append(0 if value is None else value)
+
+    def _drop(self, accounts, ordinals):
+        # entries of any of the accounts on any of the days
+        if not accounts or not ordinals or not len(self):
+            return
+
+        if np is not None:
+            keep = ~(np.in1d(self._view('account_id'), list(accounts)) & np.in1d(self._view('date'), list(ordinals)))
+            for name, typecode, _ in _COLUMNS:
+                values = array(typecode)
+                values.fromstring(self._view(name)[keep].tostring())
+                self._columns[name] = values
+        else:
+            keep = [
+                not (account in accounts and date in ordinals)
+                for account, date in izip(self._columns['account_id'], self._columns['date'])
+            ]
+            for name, typecode, _ in _COLUMNS:
+                self._columns[name] = array(typecode, (x for x, k in izip(self._columns[name], keep) if k))
+
+    def update(self, reports, start_date=None, end_date=None):
+        """
+        Add reports, replacing the entries of the accounts they were downloaded for on the days they cover. Entries
+        of other accounts are kept, so reports of some accounts can refresh their days on their own.
+
+        Days without activity have no rows, pass the date range the reports were downloaded for so entries of days
+        that no longer have activity are dropped too. Else only the days found in the reports are replaced.
+
+        :param reports: Iterable of (client_customer_id, rows), rows header first, eg. from get_reports.
+        :param start_date: First day of the reports.
+        :param end_date: Last day of the reports, defaults to start_date.
+        """
+
+        dates = {}
+        accounts = set()
+        added = AccountActivityIndex()
+
+        for client_customer_id, rows in reports:
+            # an account without activity on a day has no row for it, its old entry is dropped all the same
+            accounts.add(normalize_customer_id(client_customer_id))
+
+            if rows:
+                added._append_rows(rows[0], rows[1:], dates)
+
+        accounts.update(added._columns['account_id'])
+
+        ordinals = set(dates.values())
+        if start_date is not None:
+            low, high = self._range(start_date, end_date)
+            ordinals.update(xrange(low, high + 1))
+
+        self._drop(accounts, ordinals)
+
+        for name, _, _ in _COLUMNS:
+            self._columns[name].extend(added._columns[name])
+
+    def _view(self, name):
+        values = self._columns[name]
+        dtype = 'f8' if values.typecode == 'd' else 'i%d' % values.itemsize
+        return np.frombuffer(values, dtype=dtype)
+
+    @staticmethod
+    def _range(start_date, end_date):
+        if start_date is None:
+            return None, None if end_date is None else _to_ordinal(end_date)
+
+        low = _to_ordinal(start_date)
+        return low, low if end_date is None else _to_ordinal(end_date)
+
+    def _sums(self, start_date, end_date):
+        # numpy only: distinct accounts in the date range and the sum of each metric per account
+        low, high = self._range(start_date, end_date)
+
+        dates = self._view('date')
+        mask = np.ones(len(dates), dtype=bool)
+        if low is not None:
+            mask &= dates >= low
+        if high is not None:
+            mask &= dates <= high
+
+        accounts, inverse = np.unique(self._view('account_id')[mask], return_inverse=True)
+        if not len(accounts):
+            return accounts, {x: np.empty(0) for x in METRICS}
+
+        return accounts, {
+            x: np.bincount(inverse, weights=self._view(x)[mask], minlength=len(accounts)) for x in METRICS
+        }
+
+    def totals(self, start_date=None, end_date=None):
+        """
+        Sum metrics per account.
+
+        :param start_date: First day, or only day if end_date is None. None for all days.
+        :param end_date: Last day.
+        :return: dictionary of account id to dictionary of metric totals
+        """
+
+        if np is not None:
+            accounts, sums = self._sums(start_date, end_date)
+
+            return {
+                int(account): {
+                    'cost': float(sums['cost'][i]),
+                    'impressions': int(sums['impressions'][i]),
+                    'clicks': int(sums['clicks'][i]),
+                    'conversions': float(sums['conversions'][i])
+                }
+                for i, account in enumerate(accounts)
+            }
+
+        low, high = self._range(start_date, end_date)
+        totals = {}
+        columns = [self._columns[x] for x in ('account_id', 'date') + METRICS]
+
+        for account, date, cost, impressions, clicks, conversions in izip(*columns):
+            if (low is not None and date < low) or (high is not None and date > high):
+                continue
+
+            total = totals.get(account)
+            if total is None:
+                total = totals[account] = {'cost': 0.0, 'impressions': 0, 'clicks': 0, 'conversions': 0.0}
+
+            total['cost'] += cost
+            total['impressions'] += impressions
+            total['clicks'] += clicks
+            total['conversions'] += conversions
+
+        return totals
+
+    def accounts(self, start_date=None, end_date=None, min_cost=None, min_impressions=None, min_clicks=None,
+                 min_conversions=None):
+        """
+        Accounts whose totals over the date range reach every threshold set.
+
+        :param start_date: First day, or only day if end_date is None. None for all days.
+        :param end_date: Last day.
+        :return: sorted list of account ids
+        """
+
+        thresholds = [
+            (metric, threshold)
+            for metric, threshold in zip(METRICS, (min_cost, min_impressions, min_clicks, min_conversions))
+            if threshold is not None
+        ]
+
+        if np is not None:
+            accounts, sums = self._sums(start_date, end_date)
+
+            mask = np.ones(len(accounts), dtype=bool)
+            for metric, threshold in thresholds:
+                mask &= sums[metric] >= threshold
+
+            # np.unique returns accounts sorted
+            return [int(x) for x in accounts[mask]]
+
+        return sorted(
+            account
+            for account, total in self.totals(start_date, end_date).iteritems()
+            if all(total[metric] >= threshold for metric, threshold in thresholds)
+        )
+
+    def active_accounts(self, start_date, end_date=None):
+        """
+        Accounts with impressions on a day or over a date range.
+
+        :return: sorted list of account ids
+        """
+
+        return self.accounts(start_date, end_date, min_impressions=1)
+
+    def dates(self):
+        """
+        :return: sorted list of days in the index, as datetime
+        """
+
+        return [datetime.fromordinal(x) for x in sorted(set(self._columns['date']))]
+
+    def to_dict(self):
+        """
+        :return: dictionary structured by account id > date > metrics, as returned by get_all_account_info
+        """
+
+        lookup = {}
+        columns = [self._columns[x] for x in ('account_id', 'date') + METRICS]
+
+        for values in izip(*columns):
+            lookup.setdefault(values[0], {})[datetime.fromordinal(values[1])] = dict(zip(METRICS, values[2:]))
+
+        return lookup
+
+    def save(self, path):
+        """
+        Write index to a binary columnar file, see easyadwords.writers.
+        """
+
+        header = [name for name, _, _ in _COLUMNS]
+
+        with ColumnarWriter(path, header, [field_type for _, _, field_type in _COLUMNS]) as writer:
+            writer.write_rows(izip(*[self._columns[x] for x in header]))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read index written by save.
+
+        :return: AccountActivityIndex
+        """
+
+        with ColumnarFile(path) as f:
+            return cls({name: f.read_column(name).values for name, _, _ in _COLUMNS})
@@ -1,64 +1,40 @@
 from datetime import datetime
-from time import sleep
+from time import time
 
-from io import BytesIO
-import gzip
 import unicodecsv as csv
-import re
-from ast import literal_eval
+from collections import deque
 from contextlib import closing
-from functools import wraps
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+from Queue import Queue
+import copy
+import hashlib
+import sys
+import tempfile
+import threading
 
 from googleads import adwords
-from googleads.errors import AdWordsReportError
-from urllib2 import URLError
-
-from easyadwords.utils import serialize_soap_resp
-
-
-def retry(retries=3, delay=3, backoff=2):
-    def deco_retry(f):
-        @wraps(f)
-        def f_retry(*args, **kwargs):
-            retry_num = 1
-            last_error = None
-            max_retries = getattr(args[0], '_max_retries', retries)
-
-            while retry_num <= max_retries:
-                try:
-                    return f(*args, **kwargs)
-                except AdWordsReportError as e:
-                    if e.code >= 500:
-                        sleep_time = delay * retry_num * backoff
-                        print 'Error encountered retrieving report, sleeping for %ss. Attempt %d [%s]' % (
-                            sleep_time,
-                            retry_num,
-                            e
-                        )
-                        retry_num += 1
-                        last_error = e
-                        sleep(sleep_time)
-                    else:
-                        raise e
-                except URLError as e:
-                    sleep_time = delay * retry_num * backoff
-                    print 'Error encountered retrieving report, sleeping for %ss. Attempt %d [%s]' % (
-                        sleep_time,
-                        retry_num,
-                        e
-                    )
-                    retry_num += 1
-                    last_error = e
-                    sleep(sleep_time)
-            else:
-                raise last_error
 
-        return f_retry  # true decorator
-    return deco_retry
+from easyadwords import columnar
+from easyadwords.activity import AccountActivityIndex
+from easyadwords.cache import ReportFieldCache
+from easyadwords.cleaning import RowCleaner, is_picklable, clean_blocks
+from easyadwords.directory import AccountDirectory, FIELDS as DIRECTORY_FIELDS
+from easyadwords.governor import RateGovernor, GovernedService
+from easyadwords.hierarchy import AccountTree, normalize_customer_id
+from easyadwords.instrumentation import Instrumentation, MeteredStream, MeteredIterator, instrument_download, logger
+from easyadwords.pool import ClientPool, ServiceCache
+from easyadwords.retry import RetryPolicy, retry
+from easyadwords.utils import serialize_soap_resp, LazyRecord, iter_decompressed, iter_lines, iter_record_blocks, \
+    prefetch, date_range, date_windows, copy_gzip
 
 
 class AdwordsUtility:
-    def __init__(self, credential_path, client_customer_id=None, service_version=None, max_retries=3):
+    def __init__(self, credential_path, client_customer_id=None, service_version=None, max_retries=3,
+                 chunk_size=1024 * 16, report_fields_ttl=24 * 60 * 60, report_fields_cache_path=None, report_cache=None,
+                 spool_size=1024 * 1024 * 16, retry_budget=None, governor=None,
+                 instrumentation=None, client=None, account_directory_ttl=60 * 60, keep_alive=True,
+                 cache_services=True):
         """
         Initialize new utility object for interacting with Adwords.
 
@@ -67,9 +43,26 @@ class AdwordsUtility:
         :param credential_path: Path to googleads.yaml
         :param client_customer_id: Default customer_id, would override that stated in credential_path.
         :param service_version: If set, get specific version. Else, get the latest available version. **NOTE** Check change logs for APIs and googleads client before upgrading or switching report versions.
+        :param max_retries: Maximum attempts for functions wrapped with retry.
+        :param retry_budget: If set, stop retrying once this many seconds have passed since the first attempt.
+        :param chunk_size: Bytes read from report downloads per chunk. Bounds memory used when streaming reports.
+        :param report_fields_ttl: Seconds to cache get_report_fields results for. None to never expire.
+        :param report_fields_cache_path: If set, persist cached report fields to this JSON file.
+        :param report_cache: Optional ReportCache to serve get_report from, day by day.
+        :type report_cache: easyadwords.report_cache.ReportCache
+        :param spool_size: Bytes of a downloaded, decompressed report chunk kept in memory before spooling to a temporary file.
+        :param governor: RateGovernor limiting API calls, share one between objects using the same developer token. Defaults to a new RateGovernor without rate limits.
+        :type governor: easyadwords.governor.RateGovernor
+        :param instrumentation: Receives counters and timings of API calls and report pipeline stages, eg. InMemoryCollector or LoggingCollector. Defaults to only logging retries.
+        :type instrumentation: easyadwords.instrumentation.Instrumentation
+        :param client: AdWordsClient to use instead of loading one from credential_path, which is then ignored. It is not modified, the utility works on a shallow copy.
+        :param account_directory_ttl: Seconds to cache get_account_directory results for. None to never expire.
+        :param keep_alive: Send API requests and report downloads over a pool of keep-alive HTTPS connections shared by all threads, instead of a new connection per request. Not used for requests through a proxy.
+        :param cache_services: Reuse service objects and report downloaders per thread, keyed by service name, version and customer, instead of building one per call.
         """
 
-        self._client = adwords.AdWordsClient.LoadFromStorage(credential_path)
+        if client is None:
+            client = adwords.AdWordsClient.LoadFromStorage(credential_path)
 
         if service_version is None:
             self.service_version = sorted(adwords._SERVICE_MAP.keys())[-1]
@@ -77,13 +70,49 @@ class AdwordsUtility:
             assert service_version in adwords._SERVICE_MAP.keys()
             self.service_version = service_version
 
-        assert self._client.client_customer_id is not None or client_customer_id is not None
+        assert client.client_customer_id is not None or client_customer_id is not None
+
+        # per-customer views of a copy of client, safe to use from multiple threads
+        self._clients = ClientPool(client, keep_alive=keep_alive)
+
+        self._client = self._clients.get()
         if client_customer_id is not None:
             self._client.SetClientCustomerId(client_customer_id)
 
+        # per-thread services and report downloaders, see cache_services
+        self._services = ServiceCache() if cache_services else None
+
         self._PAGE_SIZE = 500
+        self._MAX_PAGE_SIZE = 10000
+
+        # bytes of csv per block cleaned by a worker process, see processes of get_report
+        self._PROCESS_BLOCK_SIZE = 1024 * 1024
+
+        self._instrumentation = Instrumentation() if instrumentation is None else instrumentation
 
         self._max_retries = max_retries
+        self._retry_policy = RetryPolicy(
+            retries=max_retries,
+            budget=retry_budget,
+            instrumentation=self._instrumentation
+        )
+
+        self._chunk_size = chunk_size
+        self._spool_size = spool_size
+
+        self._report_fields_cache = ReportFieldCache(ttl=report_fields_ttl, path=report_fields_cache_path)
+
+        self._report_cache = report_cache
+
+        self._governor = RateGovernor() if governor is None else governor
+
+        self._account_directory_ttl = account_directory_ttl
+        self._account_directories = {}
+        self._account_directory_locks = {}
+        self._account_directories_lock = threading.Lock()
+
+        # incremented by invalidate_account_directory, a fetch started before is not cached
+        self._account_directory_generation = 0
 
     @retry()
     def change_client_customer_id(self, client_customer_id):
@@ -92,82 +121,252 @@ class AdwordsUtility:
         """
         self._client.SetClientCustomerId(client_customer_id)
 
-    def _iterate_pages(self, service, selector, serialize=True):
-        offset = int(selector['paging']['startIndex'])
+    def get_client(self, client_customer_id=None):
+        """
+        Get AdWordsClient for a customer without changing the default client_customer_id.
 
-        return_list = []
+        Clients share credentials and configuration loaded from credential_path and can be used from multiple threads.
+
+        :param client_customer_id: If None, the default client is returned.
+        :return: googleads AdWordsClient
+        """
+
+        return self._clients.get(client_customer_id)
+
+    def _get_cached(self, name, client_customer_id, factory, cached=True):
+        if self._services is None or not cached:
+            return factory()
+
+        # keyed as views of ClientPool, None for the default client
+        key = (name, self.service_version, None if client_customer_id is None else str(client_customer_id))
+        return self._services.get(key, factory)
+
+    def _get_governed_service(self, service_name, client_customer_id=None, cached=True):
+        client = self.get_client(client_customer_id)
+        service = self._get_cached(
+            service_name,
+            client_customer_id,
+            lambda: client.GetService(service_name, version=self.service_version),
+            cached
+        )
+
+        return GovernedService(
+            service,
+            self._governor,
+            client.client_customer_id,
+            getattr(client, 'developer_token', None)
+        )
+
+    def get_rate_stats(self):
+        """
+        Get API usage counted by the rate governor.
+
+        :return: dictionary of operations, report_downloads, rate_limit_errors, server_errors, throttled_seconds and current concurrency_limit
+        """
+
+        return self._governor.stats()
+
+    @retry()
+    def _get_page(self, service, selector):
+        with self._instrumentation.stage('service.page'):
+            page = service.get(selector)
+
+        self._instrumentation.incr('service.pages')
+        self._instrumentation.incr('service.entries', len(page['entries']) if 'entries' in page else 0)
+        return page
+
+    def _iter_pages(self, service, selector, page_size):
+        offset = int(selector['paging']['startIndex'])
 
         more_pages = True
         while more_pages:
-            page = service.get(selector)
+            page = self._get_page(service, selector)
 
-            # Compile results
+            yield page
+
+            offset += page_size
+            selector['paging']['startIndex'] = str(offset)
+            more_pages = offset < int(page['totalNumEntries'])
+
+    def _iter_pages_parallel(self, service, service_factory, selector, page_size, parallel_pages, ordered=True):
+        start_index = int(selector['paging']['startIndex'])
+
+        # first page tells how many entries there are
+        page = self._get_page(service, selector)
+
+        yield page
+
+        offsets = range(start_index + page_size, int(page['totalNumEntries']), page_size)
+        if not offsets:
+            return
+
+        # suds clients are not thread safe, each worker builds its own service
+        local = threading.local()
+
+        def fetch(offset):
+            if not hasattr(local, 'service'):
+                local.service = service_factory()
+
+            page_selector = copy.deepcopy(selector)
+            page_selector['paging']['startIndex'] = str(offset)
+
+            return self._get_page(local.service, page_selector)
+
+        # at most 2 * parallel_pages pages fetching or waiting for the caller, so streaming stays bounded
+        for page in (self._iter_ordered if ordered else self._iter_unordered)(fetch, offsets, parallel_pages):
+            yield page
+
+    def _iter_entries(self, service, selector, serialize=True, prefetch_pages=0, page_size=None, parallel_pages=None,
+                      ordered=True, service_factory=None):
+        if page_size is None:
+            page_size = int(selector['paging'].get('numberResults', self._PAGE_SIZE))
+        else:
+            assert 0 < page_size <= self._MAX_PAGE_SIZE
+            selector['paging']['numberResults'] = str(page_size)
+
+        if parallel_pages:
+            pages = self._iter_pages_parallel(service, service_factory, selector, page_size, parallel_pages, ordered)
+
+        else:
+            pages = self._iter_pages(service, selector, page_size)
+
+            # fetch the next pages in the background while the caller processes the current one
+            if prefetch_pages:
+                pages = prefetch(pages, prefetch_pages)
+
+        serializer = LazyRecord if serialize == 'lazy' else serialize_soap_resp
+
+        for page in pages:
             if 'entries' in page:
                 for entry in page['entries']:
 
                     if serialize:
-                        entry = serialize_soap_resp(entry)
+                        entry = serializer(entry)
 
-                    return_list.append(entry)
+                    yield entry
 
-            offset += self._PAGE_SIZE
-            selector['paging']['startIndex'] = str(offset)
-            more_pages = offset < int(page['totalNumEntries'])
+    def _iterate_pages(self, service, selector, serialize=True, stream=False, prefetch_pages=1, **kwargs):
+        # paging advances startIndex, keep the caller's selector as passed
+        selector = copy.deepcopy(selector)
 
-        return return_list
+        if stream:
+            return self._iter_entries(service, selector, serialize, prefetch_pages, **kwargs)
+        else:
+            return list(self._iter_entries(service, selector, serialize, **kwargs))
 
     @retry()
-    def get_report_fields(self, report_type, serialize=True):
+    def get_report_fields(self, report_type, serialize=True, refresh=False):
         """
         Get details about report fields.
 
+        Serialized results are cached per service version and report type, see report_fields_ttl.
+
         :param report_type: Reference: https://developers.google.com/adwords/api/docs/appendix/reports#report-types
         :param serialize: Convert to dictionary.
+        :param refresh: Ignore cached results and fetch from ReportDefinitionService.
         :return: list of dictionaries or SOAP responses depending on serialize option.
         """
 
-        report_definition_service = self._client.GetService('ReportDefinitionService', version=self.service_version)
+        if serialize and not refresh:
+            fields = self._report_fields_cache.get(self.service_version, report_type)
+            if fields is not None:
+                return fields
+
+        report_definition_service = self._get_governed_service('ReportDefinitionService')
 
         # Get report fields.
         fields = report_definition_service.getReportFields(report_type)
 
         if serialize:
             fields = map(serialize_soap_resp, fields)
+            self._report_fields_cache.set(self.service_version, report_type, fields)
 
         return fields
 
+    def refresh_report_fields(self, report_type):
+        """
+        Fetch report fields from ReportDefinitionService and update the cache.
+
+        :param report_type: Reference: https://developers.google.com/adwords/api/docs/appendix/reports#report-types
+        :return: list of dictionaries
+        """
+
+        return self.get_report_fields(report_type, refresh=True)
+
+    def invalidate_report_fields(self, report_type=None):
+        """
+        Remove cached report fields for the current service version.
+
+        :param report_type: If set, only remove this report type. Else, remove all report types.
+        """
+
+        self._report_fields_cache.invalidate(self.service_version, report_type)
+
     @retry()
-    def get_service(self, service_name, selector, iterate_pages=True, serialize=True):
+    def _get_results(self, service, selector):
+        return service.get(selector)
+
+    def get_service(self, service_name, selector, iterate_pages=True, serialize=True, client_customer_id=None,
+                    stream=False, prefetch_pages=1, page_size=None, parallel_pages=None, ordered=True):
         """
         General purpose function for getting any service listed here: https://developers.google.com/adwords/api/docs/reference/
 
         :param service_name: Name of service
         :param selector:
         :param iterate_pages:
-        :param serialize:
+        :param serialize: Convert to dictionary. 'lazy' to return LazyRecord views, converting fields when accessed.
+        :param client_customer_id: Query this customer instead of the set client_customer_id.
+        :param stream: With iterate_pages, return a generator yielding entries page by page instead of a list.
+        :param prefetch_pages: With stream, number of pages fetched in the background ahead of the caller. 0 to disable.
+        :param page_size: With iterate_pages, entries per page, up to 10000. Defaults to numberResults of selector.
+        :param parallel_pages: With iterate_pages, fetch pages after the first on this many threads. Pages are requested with copies of selector.
+        :param ordered: With parallel_pages, return entries in page order. Else, pages are returned as they complete.
         :return:
         """
 
-        service = self._client.GetService(service_name, version=self.service_version)
+        # each page is retried on its own, a retry around the whole listing would multiply attempts
+
+        def new_service():
+            return self._get_governed_service(service_name, client_customer_id)
+
+        # pages prefetched by a stream are fetched on another thread, which must not share the cached service
+        service = self._get_governed_service(
+            service_name,
+            client_customer_id,
+            cached=not (iterate_pages and stream and prefetch_pages)
+        )
 
         if iterate_pages:
-            return self._iterate_pages(service, selector, serialize)
+            return self._iterate_pages(
+                service,
+                selector,
+                serialize,
+                stream,
+                prefetch_pages,
+                page_size=page_size,
+                parallel_pages=parallel_pages,
+                ordered=ordered,
+                service_factory=new_service
+            )
 
         else:
-            results = service.get(selector)
+            results = self._get_results(service, selector)
 
             if serialize:
+                serializer = LazyRecord if serialize == 'lazy' else serialize_soap_resp
+
                 if isinstance(results, list):
-                    return map(serialize_soap_resp, results)
+                    return map(serializer, results)
                 else:
-                    return serialize_soap_resp(results)
+                    return serializer(results)
             else:
                 return results
 
-    def list_account_labels(self):
+    def list_account_labels(self, client_customer_id=None):
         """
         Convenience function for AccountLabelService with predefined options.
 
+        :param client_customer_id: Query this customer instead of the set client_customer_id.
         :return: list of dictionaries
         """
 
@@ -179,9 +378,15 @@ class AdwordsUtility:
             }
         }
 
-        return self.get_service('AccountLabelService', selector, iterate_pages=False).get('labels', [])
+        return self.get_service(
+            'AccountLabelService',
+            selector,
+            iterate_pages=False,
+            client_customer_id=client_customer_id
+        ).get('labels', [])
 
-    def list_accounts(self, fields=None, predicates=None, include_hidden=False, include_mcc=False, serialize=True):
+    def list_accounts(self, fields=None, predicates=None, include_hidden=False, include_mcc=False, serialize=True,
+                      client_customer_id=None, stream=False):
         """
         Convenience function for ManagedCustomerService with predefined options.
 
@@ -190,6 +395,8 @@ class AdwordsUtility:
         :param include_hidden: Include hidden accounts in results.
         :param include_mcc: Include MCC in results.
         :param serialize: Convert to dictionary.
+        :param client_customer_id: List accounts under this customer instead of the set client_customer_id.
+        :param stream: Return a generator yielding accounts page by page, see get_service.
         :return: list of dictionaries or SOAP responses depending on serialize option.
         """
 
@@ -229,11 +436,435 @@ class AdwordsUtility:
             }
         }
 
-        return self.get_service('ManagedCustomerService', selector, serialize)
+        return self.get_service(
+            'ManagedCustomerService',
+            selector,
+            serialize=serialize,
+            client_customer_id=client_customer_id,
+            stream=stream
+        )
+
+    def get_account_directory(self, client_customer_id=None, refresh=False):
+        """
+        Get the accounts and account labels under a customer, indexed by customer id, label id and label name.
+
+        Directories are cached per customer and fetched again with list_accounts and list_account_labels once older
+        than account_directory_ttl. Fresh directories are returned without locking, concurrent calls for a stale one
+        fetch it once and do not hold up other customers.
+
+        :param client_customer_id: Defaults to the set client_customer_id.
+        :param refresh: Fetch even if the cached directory is fresh.
+        :return: AccountDirectory
+        """
+
+        if client_customer_id is None:
+            client_customer_id = self._client.client_customer_id
+        key = normalize_customer_id(client_customer_id)
+
+        seen = self._account_directories.get(key)
+        if not refresh and seen is not None and not seen.is_expired(self._account_directory_ttl):
+            return seen
+
+        with self._account_directories_lock:
+            lock = self._account_directory_locks.setdefault(key, threading.Lock())
+
+        with lock:
+            directory = self._account_directories.get(key)
+
+            # fetched by another thread while this one waited
+            if directory is not seen and directory is not None and \
+                    not directory.is_expired(self._account_directory_ttl):
+                return directory
+
+            generation = self._account_directory_generation
+
+            directory = AccountDirectory(
+                self.list_accounts(
+                    fields=list(DIRECTORY_FIELDS),
+                    include_mcc=True,
+                    client_customer_id=client_customer_id
+                ),
+                self.list_account_labels(client_customer_id)
+            )
+
+            with self._account_directories_lock:
+                if generation == self._account_directory_generation:
+                    self._account_directories[key] = directory
+
+            return directory
+
+    def invalidate_account_directory(self, client_customer_id=None):
+        """
+        Remove cached account directories, eg. after changing account labels. Directories being fetched while this is
+        called are returned to their callers but not cached.
+
+        :param client_customer_id: If set, only remove the directory of this customer. Else, remove all directories.
+        """
+
+        with self._account_directories_lock:
+            self._account_directory_generation += 1
+
+            if client_customer_id is None:
+                self._account_directories.clear()
+            else:
+                self._account_directories.pop(normalize_customer_id(client_customer_id), None)
+
+    def list_accounts_by_label(self, label, include_mcc=False, client_customer_id=None, refresh=False):
+        """
+        List accounts with an account label from the cached account directory, see get_account_directory.
+
+        :param label: Label id (int or long) or label name (string).
+        :param include_mcc: Include MCC in results.
+        :param client_customer_id: List accounts under this customer instead of the set client_customer_id.
+        :param refresh: Fetch the directory even if the cached one is fresh.
+        :return: list of dictionaries
+        """
+
+        directory = self.get_account_directory(client_customer_id, refresh)
+        return [directory.get(x) for x in sorted(directory.by_label(label, include_mcc))]
+
+    def _list_managed_customers(self, client_customer_id, selector):
+        service = self._get_governed_service('ManagedCustomerService', client_customer_id)
+
+        accounts = []
+        links = []
+
+        # entries only are returned by get_service, links come with each page
+        for page in self._iter_pages(service, copy.deepcopy(selector), int(selector['paging']['numberResults'])):
+            if 'entries' in page:
+                accounts.extend(serialize_soap_resp(x) for x in page['entries'])
+            if 'links' in page:
+                links.extend(serialize_soap_resp(x) for x in page['links'])
+
+        return accounts, links
+
+    def get_account_tree(self, client_customer_id=None, fields=None, include_hidden=False, max_workers=4,
+                         cache_path=None, ttl=24 * 60 * 60, refresh=False):
+        """
+        Crawl the accounts under a manager (MCC) account into an AccountTree.
+
+        The manager is queried through ManagedCustomerService, then every sub-manager whose links were not already
+        returned, level by level on max_workers threads. Links between accounts come from the ManagedCustomerLinks of
+        each response, so no call changes the client_customer_id of this object.
+
+        :param client_customer_id: Manager to crawl from, defaults to the set client_customer_id.
+        :param fields: ManagedCustomer fields, CustomerId and CanManageClients are always included.
+        :param include_hidden: Include hidden accounts in the tree.
+        :param max_workers: Maximum number of managers queried at once.
+        :param cache_path: If set, JSON file the tree is read from while younger than ttl, and written to after a crawl. Use one file per manager.
+        :param ttl: Seconds a cached tree is used for. None to never expire.
+        :param refresh: Crawl even if a cached tree is fresh.
+        :return: AccountTree
+        """
+
+        root = normalize_customer_id(client_customer_id or self._client.client_customer_id)
+
+        if cache_path is not None and not refresh:
+            tree = AccountTree.load(cache_path)
+            if tree is not None and tree.root == root and not tree.is_expired(ttl):
+                return tree
+
+        if fields is None:
+            fields = ['CustomerId', 'Name', 'CanManageClients', 'CurrencyCode', 'DateTimeZone', 'TestAccount',
+                      'AccountLabels']
+        fields = list(fields) + [x for x in ('CustomerId', 'CanManageClients') if x not in fields]
+
+        predicates = []
+        if not include_hidden:
+            predicates.append(
+                {
+                    'field': 'ExcludeHiddenAccounts',
+                    'operator': 'EQUALS',
+                    'values': 'TRUE'
+                }
+            )
+
+        selector = {
+            'fields': fields,
+            'predicates': predicates,
+            'paging': {
+                'startIndex': '0',
+                'numberResults': str(self._PAGE_SIZE)
+            }
+        }
+
+        accounts = {}
+        links = []
+        crawled = set()
+        managers = [root]
+
+        pool = ThreadPool(max_workers)
+        try:
+            while managers:
+                crawled.update(managers)
+
+                for manager_accounts, manager_links in pool.imap_unordered(
+                        lambda x: self._list_managed_customers(x, selector), managers):
+                    for account in manager_accounts:
+                        accounts[normalize_customer_id(account['customerId'])] = account
+                    links.extend(manager_links)
+
+                # a manager's response covers the accounts below it, only managers without known links are queried
+                linked = set(normalize_customer_id(x['managerCustomerId']) for x in links)
+                managers = [
+                    customer_id for customer_id, account in accounts.iteritems()
+                    if account.get('canManageClients') and customer_id not in crawled and customer_id not in linked
+                ]
+        finally:
+            pool.terminate()
+
+        tree = AccountTree(root, accounts.values(), links)
+
+        if cache_path is not None:
+            tree.save(cache_path)
+
+        return tree
+
+    @staticmethod
+    def _report_definition(start_date, end_date, report_type, fields, predicates=None):
+        return {
+            'reportName': '%s %s-%s' % (report_type, start_date.strftime('%Y%m%d'), end_date.strftime('%Y%m%d')),
+            'dateRangeType': 'CUSTOM_DATE',
+            'reportType': report_type,
+            'downloadFormat': 'GZIPPED_CSV',
+            'selector': {
+                'fields': map(lambda x: x['name'], fields),
+                'dateRange': {
+                    'min': start_date.strftime('%Y%m%d'),
+                    'max': end_date.strftime('%Y%m%d')
+                },
+                'predicates': [] if predicates is None else predicates
+            }
+        }
+
+    def _open_report_stream(self, report, client_customer_id, include_zero_impressions):
+        client = self.get_client(client_customer_id)
+
+        # customer is passed per download, so one downloader of the default client serves every customer of a thread
+        report_downloader = self._get_cached(
+            'ReportDownloader',
+            None,
+            lambda: self._client.GetReportDownloader(version=self.service_version)
+        )
+
+        # governed until the report starts streaming, which covers the time AdWords takes to generate it
+        with self._governor.request(client_customer_id, getattr(client, 'developer_token', None), report=True):
+            with self._instrumentation.stage('report.request'):
+                stream_data = report_downloader.DownloadReportAsStream(
+                    report,
+                    skip_column_header=True,
+                    skip_report_header=True,
+                    skip_report_summary=True,
+                    client_customer_id=client_customer_id,
+                    include_zero_impressions=include_zero_impressions
+                )
+
+        return instrument_download(stream_data, self._instrumentation)
+
+    def _iter_chunks(self, stream_data, compressed):
+        if compressed:
+            return iter_decompressed(stream_data, self._chunk_size)
+
+        # spools already hold the decompressed report
+        return iter(lambda: stream_data.read(self._chunk_size), b'')
+
+    def _parse_report_stream(self, stream_data, compressed=True):
+        if self._instrumentation.enabled:
+            return self._iter_metered_report_stream(stream_data, compressed)
+
+        return csv.reader(iter_lines(self._iter_chunks(stream_data, compressed)))
+
+    def _iter_report_blocks(self, stream_data, compressed=True):
+        return iter_record_blocks(self._iter_chunks(stream_data, compressed), self._PROCESS_BLOCK_SIZE)
+
+    def _iter_metered_report_stream(self, stream_data, compressed=True):
+        # each stage's time includes the stages feeding it, subtract to get time spent in the stage itself
+        source = MeteredStream(stream_data)
+        chunks = MeteredIterator(self._iter_chunks(source, compressed), count_bytes=True)
+        rows = MeteredIterator(csv.reader(iter_lines(chunks)))
+
+        try:
+            for row in rows:
+                yield row
+        finally:
+            self._instrumentation.incr('report.bytes_decompressed', chunks.bytes)
+            self._instrumentation.timing('report.decompress', chunks.seconds - source.seconds)
+            self._instrumentation.timing('report.parse', rows.seconds - chunks.seconds)
+
+    def _iter_report_rows(self, report, client_customer_id, include_zero_impressions, parse):
+        attempt = 0
+        started = time()
+
+        while True:
+            attempt += 1
+            row_yielded = False
+
+            try:
+                # decompress, split and parse the report as it streams in, rows are yielded before the download
+                # completes. failures can only be retried until the first row is out, after that see spool.
+                stream_data = self._open_report_stream(report, client_customer_id, include_zero_impressions)
+
+                with closing(stream_data):
+                    for row in parse(stream_data):
+                        row_yielded = True
+                        yield row
+                return
+
+            except Exception as e:
+                sleep_time = None if row_yielded else self._retry_policy.next_delay(e, attempt, started)
+                if sleep_time is None:
+                    raise
+
+                self._retry_policy.wait(e, attempt, sleep_time)
+
+    def _iter_spooled_report_rows(self, report, client_customer_id, include_zero_impressions, parse):
+        with closing(self._download_report_spool(report, client_customer_id, include_zero_impressions)) as spool:
+            for row in parse(spool, compressed=False):
+                yield row
 
     @retry()
+    def _download_report_file(self, report, client_customer_id, include_zero_impressions, key, date):
+        # the report is decompressed once, to check it is complete and into a spool to parse
+        spool = tempfile.SpooledTemporaryFile(max_size=self._spool_size)
+
+        try:
+            with closing(self._open_report_stream(report, client_customer_id, include_zero_impressions)) as stream_data:
+                self._report_cache.write(key, date, stream_data, self._chunk_size, decompressed=spool)
+        except Exception:
+            spool.close()
+            raise
+
+        spool.seek(0)
+        return spool
+
+    def _iter_cached_report_rows(self, start_date, end_date, report_type, fields, predicates, client_customer_id,
+                                 include_zero_impressions, max_workers, parse):
+        key = self._report_cache.key(
+            client_customer_id,
+            report_type,
+            [x['name'] for x in fields],
+            predicates,
+            include_zero_impressions,
+            self.service_version
+        )
+
+        # one report per day, only days missing from cache or still changing are downloaded, concurrently
+        def fetch(date):
+            path = self._report_cache.get(key, date)
+
+            if path is not None:
+                return open(path, 'rb'), True
+
+            report = self._report_definition(date, date, report_type, fields, predicates)
+            return self._download_report_file(report, client_customer_id, include_zero_impressions, key, date), False
+
+        try:
+            for f, compressed in self._iter_ordered(
+                    fetch, list(date_range(start_date, end_date)), max_workers, cleanup=lambda x: x[0].close()):
+                with closing(f):
+                    for row in parse(f, compressed):
+                        yield row
+        finally:
+            self._report_cache.evict()
+
+    @retry()
+    def _download_report_spool(self, report, client_customer_id, include_zero_impressions):
+        # decompressed report goes to memory, or to disk once over spool_size
+        spool = tempfile.SpooledTemporaryFile(max_size=self._spool_size)
+
+        try:
+            # a truncated download raises here, where it is retried, rather than while parsing
+            with closing(self._open_report_stream(report, client_customer_id, include_zero_impressions)) as stream_data:
+                copy_gzip(stream_data, None, self._chunk_size, decompressed=spool)
+        except Exception:
+            spool.close()
+            raise
+
+        spool.seek(0)
+        return spool
+
+    def _iter_chunked_report_rows(self, start_date, end_date, report_type, fields, predicates, client_customer_id,
+                                  include_zero_impressions, chunk_days, max_workers, parse):
+        windows = list(date_windows(start_date, end_date, chunk_days))
+
+        def fetch(window):
+            report = self._report_definition(window[0], window[1], report_type, fields, predicates)
+            return self._download_report_spool(report, client_customer_id, include_zero_impressions)
+
+        # windows download concurrently and each retries on its own, in date order
+        for spool in self._iter_ordered(fetch, windows, max_workers, cleanup=lambda x: x.close()):
+            with closing(spool):
+                for row in parse(spool, compressed=False):
+                    yield row
+
+    @staticmethod
+    def _iter_ordered(f, items, max_workers, cleanup=None):
+        # Pool.imap would run f on every item ahead of a slow consumer, submit a bounded window instead
+        workers = max(1, min(max_workers, len(items)))
+        max_pending = 2 * workers
+        remaining = iter(items)
+        pending = deque()
+
+        pool = ThreadPool(workers)
+        try:
+            for item in islice(remaining, max_pending):
+                pending.append(pool.apply_async(f, (item,)))
+
+            while pending:
+                result = pending.popleft().get()
+
+                for item in islice(remaining, 1):
+                    pending.append(pool.apply_async(f, (item,)))
+
+                yield result
+        finally:
+            pool.terminate()
+
+            # results never handed out, eg. spools downloaded but never read
+            if cleanup is not None:
+                for result in pending:
+                    if result.ready() and result.successful():
+                        cleanup(result.get())
+
+    @staticmethod
+    def _iter_unordered(f, items, max_workers):
+        # as _iter_ordered, results are handed out as they complete
+        workers = max(1, min(max_workers, len(items)))
+        max_pending = 2 * workers
+        remaining = iter(items)
+        done = Queue()
+        pending = 0
+
+        def run(item):
+            try:
+                done.put((f(item), None))
+            except Exception:
+                done.put((None, sys.exc_info()))
+
+        pool = ThreadPool(workers)
+        try:
+            for item in islice(remaining, max_pending):
+                pool.apply_async(run, (item,))
+                pending += 1
+
+            while pending:
+                result, exc_info = done.get()
+                pending -= 1
+
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+
+                for item in islice(remaining, 1):
+                    pool.apply_async(run, (item,))
+                    pending += 1
+
+                yield result
+        finally:
+            pool.terminate()
+
     def get_report(self, start_date, end_date, report_type, fields, additional_fields=None, predicates=None,
-                   client_customer_id=None, include_zero_impressions=False):
+                   client_customer_id=None, include_zero_impressions=False, use_cache=True, chunk_days=None,
+                   max_workers=4, spool=False, processes=None):
         """
         Downloads and cleans report.
 
@@ -269,40 +900,17 @@ class AdwordsUtility:
         :type predicates: list of dictionaries representing Predicate objects
         :param client_customer_id: Overwrite set client_customer_id when downloading report.
         :param include_zero_impressions: **Check compatibility with report type**
+        :param use_cache: If a report_cache is set, download the report one day at a time, max_workers days at once, and serve days already downloaded from the cache. chunk_days is not used. **Rows are per day, include a date field to tell them apart.**
+        :param chunk_days: If set, split the date range into windows of chunk_days days, downloaded concurrently and returned in date order. A failed window is retried on its own. **Rows are per window, include a date field to tell them apart.**
+        :param max_workers: With chunk_days or a report_cache, maximum number of windows/days downloading at once.
+        :param spool: Download the whole report to a spool before parsing, so a failure at any point of the download is retried. Otherwise, rows are yielded as the report streams in and failures are only retried until the first row. Downloads with use_cache and chunk_days are always spooled per day/window.
+        :param processes: If set, parse and clean the report in blocks of whole lines on this many worker processes, rows stay in order. Custom cleaning functions must be picklable, eg. module level functions instead of lambdas, else the report is cleaned in this process.
         :return: Generator object for cleaned report
         """
 
-        def _default_cleaner(field_value, field_type):
-            field_value = field_value.strip()
-
-            if field_value == '--':
-                return None
-
-            elif 'List' in field_type:
-                if field_value is None or field_value == '':
-                    return None
-                else:
-                    return ';'.join(literal_eval(field_value))
-
-            elif field_type == 'Money':
-                # Money is returned as micro units
-                # divide and round to 6 dp to avoid representation errors when dividing
-                return round(float(re.sub(r'[^\d\-.]+', '', field_value)) / 1000000.0, 6)
-
-            elif field_type == 'Date':
-                return datetime.strptime(field_value, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S')
-
-            elif field_type == 'Double':
-                return float(re.sub(r'[^\d\-.]+', '', field_value))
-
-            elif field_type in ('Long', 'Integer'):
-                return int(float(re.sub(r'[^\d\-.]+', '', field_value)))
-
-            else:
-                return field_value
-
         assert isinstance(start_date, datetime)
         assert isinstance(end_date, datetime)
+        assert max_workers >= 1
 
         if client_customer_id is None:
             client_customer_id = self._client.client_customer_id
@@ -319,44 +927,6 @@ class AdwordsUtility:
             assert all(isinstance(x, dict) for x in additional_fields)
             assert all('name' in x and 'value' in x for x in additional_fields)
 
-        report_downloader = self._client.GetReportDownloader(version=self.service_version)
-
-        report = {
-            'reportName': '%s %s-%s' % (report_type, start_date.strftime('%Y%m%d'), end_date.strftime('%Y%m%d')),
-            'dateRangeType': 'CUSTOM_DATE',
-            'reportType': report_type,
-            'downloadFormat': 'GZIPPED_CSV',
-            'selector': {
-                'fields': map(lambda x: x['name'], fields),
-                'dateRange': {
-                    'min': start_date.strftime('%Y%m%d'),
-                    'max': end_date.strftime('%Y%m%d')
-                },
-                'predicates': [] if predicates is None else predicates
-            }
-        }
-
-        # stream compressed report to buffer, seek(0), decompress and load it into csv.reader
-        report_data = BytesIO()
-
-        with closing(report_downloader.DownloadReportAsStream(
-            report,
-            skip_column_header=True,
-            skip_report_header=True,
-            skip_report_summary=True,
-            client_customer_id=client_customer_id,
-            include_zero_impressions=include_zero_impressions
-        )) as stream_data:
-
-            while True:
-                chunk = stream_data.read(1024 * 16)
-                if not chunk:
-                    break
-                report_data.write(chunk)
-
-        report_data.seek(0)
-        csv_reader = csv.reader(gzip.GzipFile(fileobj=report_data, mode='rb'))
-
         # clean data
         report_fields = self.get_report_fields(report_type)
         report_dtypes = {x['fieldName']: x['fieldType'] for x in report_fields}
@@ -369,47 +939,250 @@ class AdwordsUtility:
             if 'type' not in query_field:
                 query_field['type'] = report_dtypes[query_field['name']]
 
-        # yield header first. alias if exists, else name
-        header = map(lambda x: x['alias'] if 'alias' in x else x['name'], fields)
+        # compile cleaning plan once, yield header first
+        row_cleaner = RowCleaner(fields, additional_fields)
 
-        # add additional field headers
-        for additional_field in additional_fields:
-            if additional_field.get('prepend', None) is True:
-                header.insert(0, additional_field['name'])
-            else:
-                header.append(additional_field['name'])
+        yield row_cleaner.header
 
-        yield header
+        if processes and not is_picklable(row_cleaner):
+            logger.warning('Cleaning of %s can not be sent to worker processes, cleaning in this process', report_type)
+            processes = None
 
-        for row in csv_reader:
-            cleaned_row = []
-            for index, field_config in enumerate(fields):
-                if 'cleaning' in field_config:
-                    cleaned_value = field_config['cleaning'](row[index])
-                else:
-                    cleaned_value = _default_cleaner(row[index], field_config['type'])
+        # with processes, sources yield blocks of csv lines instead of parsed rows
+        parse = self._iter_report_blocks if processes else self._parse_report_stream
 
-                cleaned_row.append(cleaned_value)
+        if self._report_cache is not None and use_cache:
+            rows = self._iter_cached_report_rows(
+                start_date, end_date, report_type, fields, predicates, client_customer_id, include_zero_impressions,
+                max_workers, parse
+            )
+        elif chunk_days:
+            rows = self._iter_chunked_report_rows(
+                start_date, end_date, report_type, fields, predicates, client_customer_id, include_zero_impressions,
+                chunk_days, max_workers, parse
+            )
+        elif spool:
+            report = self._report_definition(start_date, end_date, report_type, fields, predicates)
+            rows = self._iter_spooled_report_rows(report, client_customer_id, include_zero_impressions, parse)
+        else:
+            report = self._report_definition(start_date, end_date, report_type, fields, predicates)
+            rows = self._iter_report_rows(report, client_customer_id, include_zero_impressions, parse)
+
+        def clean(rows):
+            if processes:
+                return clean_blocks(rows, row_cleaner, processes)
+            return row_cleaner.clean_rows(rows)
+
+        if not self._instrumentation.enabled:
+            for cleaned_row in clean(rows):
+                yield cleaned_row
+            return
+
+        rows = MeteredIterator(rows)
+        cleaned_rows = MeteredIterator(clean(rows))
+
+        try:
+            for cleaned_row in cleaned_rows:
+                yield cleaned_row
+        finally:
+            self._instrumentation.timing('report.clean', cleaned_rows.seconds - rows.seconds)
+            self._instrumentation.timing('report.total', cleaned_rows.seconds)
+            self._instrumentation.incr('report.rows', cleaned_rows.items)
+
+    def _write_raw_report(self, report, client_customer_id, include_zero_impressions, sink, chunk_size, checksum):
+        # written bytes can only be taken back on retry if the sink can seek, else only failures before the first byte
+        try:
+            start = sink.tell()
+        except (AttributeError, IOError):
+            start = None
+
+        attempt = 0
+        started = time()
+
+        while True:
+            attempt += 1
+            size = 0
+            digest = hashlib.new(checksum)
+
+            try:
+                stream_data = self._open_report_stream(report, client_customer_id, include_zero_impressions)
+
+                with closing(stream_data):
+                    while True:
+                        chunk = stream_data.read(chunk_size)
+                        if not chunk:
+                            break
+
+                        sink.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+
+                return size, digest.hexdigest()
+
+            except Exception as e:
+                sleep_time = None
+                if size == 0 or start is not None:
+                    sleep_time = self._retry_policy.next_delay(e, attempt, started)
+
+                if sleep_time is None:
+                    raise
+
+                if size:
+                    sink.seek(start)
+                    sink.truncate()
+
+                self._retry_policy.wait(e, attempt, sleep_time)
+
+    def download_report_raw(self, start_date, end_date, report_type, fields, sink, predicates=None,
+                            client_customer_id=None, include_zero_impressions=False, chunk_size=1024 * 1024,
+                            checksum='md5'):
+        """
+        Downloads report as is, GZIPPED_CSV without headers or summary, to a file or file-like sink.
 
-            # add additional field values
-            for additional_field in additional_fields:
-                if additional_field.get('prepend', None) is True:
-                    cleaned_row.insert(0, additional_field['value'])
-                else:
-                    cleaned_row.append(additional_field['value'])
+        Bytes are copied in chunk_size pieces without being decompressed or parsed, for loading into a warehouse or
+        object storage. Columns are in the order of fields, see the returned metadata for their Adwords types.
+        Parameters are the same as get_report.
+
+        :param sink: Path to write to, or file-like object with write. Failures are retried until the first byte is written, or at any point if sink supports seek and truncate.
+        :param chunk_size: Bytes per read from the download and write to sink.
+        :param checksum: hashlib algorithm of the checksum computed over the written bytes.
+        :return: dictionary of metadata: bytes, checksum, checksum_algorithm, fields (name, alias and type per column), report_type, client_customer_id, start_date and end_date
+        """
+
+        assert isinstance(start_date, datetime)
+        assert isinstance(end_date, datetime)
+
+        if client_customer_id is None:
+            client_customer_id = self._client.client_customer_id
+
+        if predicates is not None:
+            assert isinstance(predicates, list)
+            assert all(isinstance(x, dict) for x in predicates)
+
+        report_dtypes = {x['fieldName']: x['fieldType'] for x in self.get_report_fields(report_type)}
+
+        # ensure all fields are actually found in report
+        assert all(x['name'] in report_dtypes.keys() for x in fields)
+
+        report = self._report_definition(start_date, end_date, report_type, fields, predicates)
+
+        if isinstance(sink, basestring):
+            with open(sink, 'wb') as f:
+                size, digest = self._write_raw_report(
+                    report, client_customer_id, include_zero_impressions, f, chunk_size, checksum
+                )
+        else:
+            size, digest = self._write_raw_report(
+                report, client_customer_id, include_zero_impressions, sink, chunk_size, checksum
+            )
+
+        return {
+            'bytes': size,
+            'checksum': digest,
+            'checksum_algorithm': checksum,
+            'fields': [
+                {
+                    'name': x['name'],
+                    'alias': x.get('alias', x['name']),
+                    'type': x.get('type', report_dtypes[x['name']])
+                }
+                for x in fields
+            ],
+            'report_type': report_type,
+            'client_customer_id': client_customer_id,
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d')
+        }
+
+    def get_report_columnar(self, start_date, end_date, report_type, fields, additional_fields=None, predicates=None,
+                            client_customer_id=None, include_zero_impressions=False, batch_size=None):
+        """
+        Downloads and cleans report into typed columns instead of rows.
 
-            yield cleaned_row
+        Money and Double fields are stored as float arrays, Long and Integer fields as integer arrays, other fields and
+        additional fields are dictionary encoded. If a field has custom cleaning, set its 'type' to match the cleaned
+        values, eg. {'name': 'Ctr', 'type': 'Double', 'cleaning': ...}. Parameters are the same as get_report.
 
-    def get_all_account_info(self, start_date, end_date):
+        :param batch_size: If set, return a generator of tables of at most batch_size rows instead of one table.
+        :return: ColumnarTable, or generator object for ColumnarTable if batch_size is set.
+        """
+
+        report = self.get_report(
+            start_date,
+            end_date,
+            report_type,
+            fields,
+            additional_fields=additional_fields,
+            predicates=predicates,
+            client_customer_id=client_customer_id,
+            include_zero_impressions=include_zero_impressions
+        )
+
+        # field types are filled in once the header is out
+        header = next(report)
+        types = RowCleaner(fields, additional_fields).types
+
+        if batch_size:
+            return columnar.iter_batches(header, types, report, batch_size)
+        else:
+            return columnar.to_table(header, types, report)
+
+    def _fetch_report(self, client_customer_id, *args, **kwargs):
+        # rows are materialized anyway, spool so failures anywhere in the download are retried
+        rows = self.get_report(*args, client_customer_id=client_customer_id, spool=True, **kwargs)
+        return client_customer_id, list(rows)
+
+    def get_reports(self, client_customer_ids, start_date, end_date, report_type, fields, additional_fields=None,
+                    predicates=None, include_zero_impressions=False, max_workers=4):
+        """
+        Downloads and cleans the same report for multiple accounts concurrently.
+
+        Reports are fetched on a pool of max_workers threads, each using its own customer's client from get_client,
+        so the client_customer_id of this object is never changed. Parameters are the same as get_report.
+
+        :param client_customer_ids: Accounts to download report for.
+        :type client_customer_ids: list
+        :param max_workers: Maximum number of reports downloading at once.
+        :return: Generator object for (client_customer_id, rows) in order of completion. rows is a list of cleaned rows, header first.
+        """
+
+        assert max_workers >= 1
+
+        # warm report fields cache once instead of once per thread
+        self.get_report_fields(report_type)
+
+        def fetch(client_customer_id):
+            # get_report fills in field types, give each thread its own copy
+            return self._fetch_report(
+                client_customer_id,
+                start_date,
+                end_date,
+                report_type,
+                [dict(x) for x in fields],
+                additional_fields=additional_fields,
+                predicates=predicates,
+                include_zero_impressions=include_zero_impressions
+            )
+
+        # at most 2 * max_workers reports downloading or waiting for the caller
+        for result in self._iter_unordered(fetch, list(client_customer_ids), max_workers):
+            yield result
+
+    def get_all_account_info(self, start_date, end_date, max_workers=4, as_index=False, index=None):
         """
         Convenience function wrapping ACCOUNT_PERFORMANCE_REPORT to get and parse accounts info.
         Can be used to subsequently filter out accounts without any activity for specific days.
+        Accounts are downloaded concurrently, see get_reports.
 
         :param start_date: Start date
         :type start_date: datetime object
         :param end_date: End date
         :type start_date: datetime object
-        :return: Dictionary structured by account id > date > metrics
+        :param max_workers: Maximum number of reports downloading at once.
+        :param as_index: Return an AccountActivityIndex instead of nested dictionaries.
+        :param index: AccountActivityIndex to update with the days from start_date to end_date, implies as_index.
+        :type index: easyadwords.activity.AccountActivityIndex
+        :return: Dictionary structured by account id > date > metrics, or AccountActivityIndex
         """
 
         fields = [
@@ -439,22 +1212,30 @@ class AdwordsUtility:
             }
         ]
 
-        account_lookup = {}
-
         account_list = self.list_accounts()
 
-        for account in account_list:
-            report = self.get_report(
-                start_date,
-                end_date,
-                'ACCOUNT_PERFORMANCE_REPORT',
-                fields,
-                client_customer_id=account['customerId'],
-                include_zero_impressions=True
-            )
+        reports = self.get_reports(
+            [account['customerId'] for account in account_list],
+            start_date,
+            end_date,
+            'ACCOUNT_PERFORMANCE_REPORT',
+            fields,
+            include_zero_impressions=True,
+            max_workers=max_workers
+        )
+
+        if as_index or index is not None:
+            if index is None:
+                index = AccountActivityIndex()
+
+            index.update(reports, start_date, end_date)
+            return index
+
+        account_lookup = {}
 
-            header = next(report)
-            for row in report:
+        for _, report in reports:
+            header = report[0]
+            for row in report[1:]:
                 row_dict = dict(zip(header, row))
                 report_account_id = row_dict.pop('account_id')
                 report_date = datetime.strptime(row_dict.pop('date'), '%Y-%m-%d %H:%M:%S')
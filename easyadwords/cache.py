@@ -0,0 +1,159 @@
+import json
+import os
+import tempfile
+from threading import RLock
+from time import time
+
+
+def _encode_strings(obj):
+    # json returns unicode, serialize_soap_resp returns utf-8 encoded str
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    elif isinstance(obj, list):
+        return [_encode_strings(x) for x in obj]
+    elif isinstance(obj, dict):
+        return {_encode_strings(k): _encode_strings(v) for k, v in obj.iteritems()}
+    else:
+        return obj
+
+
+def write_json(path, obj):
+    """
+    Write obj as JSON to path atomically, readers never see a partially written file.
+    """
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            json.dump(obj, f)
+        os.rename(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def read_json(path):
+    """
+    Read JSON written by write_json, with strings encoded to utf-8 str.
+
+    :return: decoded object, or None if path does not exist or is corrupt.
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'rb') as f:
+        try:
+            return _encode_strings(json.load(f))
+        except ValueError:
+            return None
+
+
+class ReportFieldCache(object):
+    """
+    Cache for serialized ReportDefinitionService.getReportFields results, keyed by (service_version, report_type).
+
+    Entries are held in memory and evicted once older than ttl. If path is set, the cache is loaded from and
+    written through to a local JSON file so new processes start warm.
+    """
+
+    def __init__(self, ttl=None, path=None):
+        """
+        :param ttl: Seconds before an entry is considered stale. None to never expire.
+        :param path: Optional path of JSON file to persist cache to.
+        """
+
+        self.ttl = ttl
+        self.path = path
+
+        self._entries = {}
+        self._lock = RLock()
+
+        if path is not None:
+            self.load()
+
+    @staticmethod
+    def _key(service_version, report_type):
+        return '%s|%s' % (service_version, report_type)
+
+    def _is_fresh(self, entry):
+        return self.ttl is None or time() - entry['fetched_at'] < self.ttl
+
+    def get(self, service_version, report_type):
+        """
+        Get cached report fields.
+
+        :return: list of dictionaries, or None if not cached or expired.
+        """
+
+        key = self._key(service_version, report_type)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            if not self._is_fresh(entry):
+                del self._entries[key]
+                return None
+
+            return [dict(x) for x in entry['fields']]
+
+    def set(self, service_version, report_type, fields):
+        """
+        Store report fields, writing through to path if set.
+
+        :param fields: Serialized report fields.
+        :type fields: list of dictionaries
+        """
+
+        with self._lock:
+            self._entries[self._key(service_version, report_type)] = {
+                'fetched_at': time(),
+                'fields': [dict(x) for x in fields]
+            }
+
+            if self.path is not None:
+                self.save()
+
+    def invalidate(self, service_version=None, report_type=None):
+        """
+        Remove entries from the cache. With no arguments, the whole cache is cleared.
+
+        :param service_version: Only remove entries for this version.
+        :param report_type: Only remove entries for this report type.
+        """
+
+        with self._lock:
+            for key in list(self._entries):
+                version, report = key.split('|', 1)
+
+                if service_version is not None and version != service_version:
+                    continue
+                if report_type is not None and report != report_type:
+                    continue
+
+                del self._entries[key]
+
+            if self.path is not None:
+                self.save()
+
+    def load(self):
+        """
+        Load entries from path, dropping any that have expired.
+        """
+
+        # missing or corrupt file, start cold
+        entries = read_json(self.path) or {}
+
+        with self._lock:
+            self._entries = {k: v for k, v in entries.iteritems() if self._is_fresh(v)}
+
+    def save(self):
+        """
+        Write entries to path atomically.
+        """
+
+        with self._lock:
+            write_json(self.path, self._entries)
@@ -0,0 +1,257 @@
+from datetime import datetime
+import re
+from ast import literal_eval
+from collections import deque
+from multiprocessing import Pool
+import cPickle as pickle
+
+import unicodecsv as csv
+
+from easyadwords.utils import iter_lines
+
+# datetime.strptime imports _strptime on first use, which is not thread safe
+import _strptime  # noqa
+
+_NON_NUMERIC = re.compile(r'[^\d\-.]+')
+
+
+def clean_string(field_value):
+    field_value = field_value.strip()
+
+    if field_value == '--':
+        return None
+
+    return field_value
+
+
+def clean_list(field_value):
+    field_value = field_value.strip()
+
+    if field_value == '--' or field_value == '':
+        return None
+
+    return ';'.join(literal_eval(field_value))
+
+
+def clean_money(field_value):
+    # Money is returned as micro units
+    # divide and round to 6 dp to avoid representation errors when dividing
+    field_value = field_value.strip()
+
+    try:
+        return round(float(field_value) / 1000000.0, 6)
+    except ValueError:
+        if field_value == '--':
+            return None
+        return round(float(_NON_NUMERIC.sub('', field_value)) / 1000000.0, 6)
+
+
+def clean_double(field_value):
+    field_value = field_value.strip()
+
+    try:
+        return float(field_value)
+    except ValueError:
+        if field_value == '--':
+            return None
+        return float(_NON_NUMERIC.sub('', field_value))
+
+
+def clean_integer(field_value):
+    field_value = field_value.strip()
+
+    try:
+        return int(field_value)
+    except ValueError:
+        if field_value == '--':
+            return None
+        return int(float(_NON_NUMERIC.sub('', field_value)))
+
+
+class DateCleaner(object):
+    """
+    Converts Adwords dates (%Y-%m-%d) to '%Y-%m-%d %H:%M:%S'.
+
+    Reports only contain a handful of distinct dates, so results are memoized per instance.
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    def __call__(self, field_value):
+        try:
+            return self._cache[field_value]
+        except KeyError:
+            stripped = field_value.strip()
+
+            if stripped == '--':
+                cleaned = None
+            else:
+                cleaned = datetime.strptime(stripped, '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S')
+
+            self._cache[field_value] = cleaned
+            return cleaned
+
+
+def get_cleaner(field_type):
+    """
+    Get default cleaning function for an Adwords field type.
+
+    :param field_type: fieldType as returned by ReportDefinitionService, eg. Money, Double, Long, Date.
+    :return: function taking the raw string value and returning the cleaned value
+    """
+
+    if 'List' in field_type:
+        return clean_list
+
+    elif field_type == 'Money':
+        return clean_money
+
+    elif field_type == 'Date':
+        return DateCleaner()
+
+    elif field_type == 'Double':
+        return clean_double
+
+    elif field_type in ('Long', 'Integer'):
+        return clean_integer
+
+    else:
+        return clean_string
+
+
+class RowCleaner(object):
+    """
+    Cleaning plan for a report, compiled once from its fields and additional fields.
+
+    Each field is resolved to a single converter up front (custom 'cleaning' function or default cleaner for its
+    type), and the values of additional fields are laid out into fixed prefix/suffix lists, so cleaning a row is a
+    single pass over the converters.
+    """
+
+    def __init__(self, fields, additional_fields=None):
+        """
+        :param fields: Report fields, each with 'type' already filled in unless 'cleaning' is provided.
+        :type fields: list of dictionaries
+        :param additional_fields: Static fields to add to each row.
+        :type additional_fields: list of dictionaries
+        """
+
+        additional_fields = [] if additional_fields is None else additional_fields
+
+        self.converters = tuple(
+            x['cleaning'] if 'cleaning' in x else get_cleaner(x['type'])
+            for x in fields
+        )
+
+        # alias if exists, else name
+        header = [x['alias'] if 'alias' in x else x['name'] for x in fields]
+        types = [x.get('type') for x in fields]
+        prefix = []
+        suffix = []
+
+        # prepended fields are inserted at the front one by one, so the last one ends up first
+        for additional_field in additional_fields:
+            if additional_field.get('prepend', None) is True:
+                header.insert(0, additional_field['name'])
+                types.insert(0, None)
+                prefix.insert(0, additional_field['value'])
+            else:
+                header.append(additional_field['name'])
+                types.append(None)
+                suffix.append(additional_field['value'])
+
+        self.header = header
+        self.types = types
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def __call__(self, row):
+        cleaned_row = [convert(value) for convert, value in zip(self.converters, row)]
+
+        if self.prefix:
+            cleaned_row = self.prefix + cleaned_row
+        if self.suffix:
+            cleaned_row.extend(self.suffix)
+
+        return cleaned_row
+
+    def clean_rows(self, rows):
+        """
+        Clean an iterable of raw rows.
+
+        :param rows: Iterable of lists of raw string values, eg. csv.reader
+        :return: generator object for cleaned rows
+        """
+
+        converters = self.converters
+        prefix = self.prefix
+        suffix = self.suffix
+
+        if prefix:
+            for row in rows:
+                cleaned_row = prefix + [convert(value) for convert, value in zip(converters, row)]
+                cleaned_row.extend(suffix)
+                yield cleaned_row
+        else:
+            for row in rows:
+                cleaned_row = [convert(value) for convert, value in zip(converters, row)]
+                cleaned_row.extend(suffix)
+                yield cleaned_row
+
+
+def is_picklable(obj):
+    """
+    Whether obj can be sent to a worker process, eg. False for a RowCleaner with lambda cleaning functions.
+    """
+
+    try:
+        pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return False
+    return True
+
+
+# RowCleaner of the report a worker process is cleaning, set once by the pool initializer
+_worker_cleaner = None
+
+
+def _init_worker(pickled_cleaner):
+    global _worker_cleaner
+    _worker_cleaner = pickle.loads(pickled_cleaner)
+
+
+def _clean_block(block):
+    return list(_worker_cleaner.clean_rows(csv.reader(iter_lines([block]))))
+
+
+def clean_blocks(blocks, row_cleaner, processes, max_pending=None):
+    """
+    Parse and clean blocks of csv records on a pool of processes, in order.
+
+    :param blocks: Iterable of byte strings of whole csv records, eg. output of iter_record_blocks.
+    :param row_cleaner: Picklable RowCleaner, see is_picklable.
+    :param processes: Number of worker processes.
+    :param max_pending: Maximum blocks submitted ahead of the caller, bounds memory. Defaults to twice processes.
+    :return: generator object for cleaned rows
+    """
+
+    max_pending = processes * 2 if max_pending is None else max_pending
+
+    pool = Pool(processes, _init_worker, (pickle.dumps(row_cleaner, pickle.HIGHEST_PROTOCOL),))
+    try:
+        # Pool.imap would read ahead all blocks, submit a bounded window instead
+        pending = deque()
+
+        for block in blocks:
+            pending.append(pool.apply_async(_clean_block, (block,)))
+
+            if len(pending) >= max_pending:
+                for row in pending.popleft().get():
+                    yield row
+
+        while pending:
+            for row in pending.popleft().get():
+                yield row
+    finally:
+        pool.terminate()
@@ -0,0 +1,213 @@
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FLOAT_TYPES = ('Money', 'Double')
+INTEGER_TYPES = ('Long', 'Integer')
+
+
+class NumericColumn(object):
+    """
+    Column of floats (typecode 'd') or integers (typecode 'l') backed by array.array.
+
+    None values are stored as 0 and tracked in mask (1 for valid, 0 for None), which is only allocated once the first
+    None is appended.
+    """
+
+    def __init__(self, typecode, values=None, mask=None):
+        self.typecode = typecode
+        self.values = array(typecode) if values is None else values
+        self.mask = mask
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if self.mask is not None and not self.mask[index]:
+            return None
+        return self.values[index]
+
+    def append(self, value):
+        if value is None:
+            if self.mask is None:
+                self.mask = bytearray(b'\x01') * len(self.values)
+            self.mask.append(0)
+            self.values.append(0)
+        else:
+            if self.mask is not None:
+                self.mask.append(1)
+            self.values.append(value)
+
+    def to_numpy(self):
+        """
+        :return: numpy array, or masked array if column contains None.
+        """
+
+        values = np.frombuffer(self.values, dtype='f8' if self.typecode == 'd' else 'i%d' % self.values.itemsize)
+
+        if self.mask is None:
+            return values
+        return np.ma.masked_array(values, mask=np.frombuffer(self.mask, dtype='u1') == 0)
+
+
+class DictionaryColumn(object):
+    """
+    Dictionary encoded column, each distinct value is stored once and rows hold an integer code. None is coded as -1.
+    """
+
+    def __init__(self, codes=None, dictionary=None):
+        self.codes = array('i') if codes is None else codes
+        self.dictionary = [] if dictionary is None else dictionary
+        self._index = {v: i for i, v in enumerate(self.dictionary)}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        code = self.codes[index]
+        return None if code < 0 else self.dictionary[code]
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(-1)
+            return
+
+        try:
+            code = self._index[value]
+        except KeyError:
+            code = self._index[value] = len(self.dictionary)
+            self.dictionary.append(value)
+
+        self.codes.append(code)
+
+    def to_numpy(self):
+        """
+        :return: numpy object array of decoded values.
+        """
+
+        dictionary = np.empty(len(self.dictionary) + 1, dtype=object)
+        dictionary[:-1] = self.dictionary
+        dictionary[-1] = None
+
+        # code -1 indexes the trailing None
+        return dictionary[np.frombuffer(self.codes, dtype='i%d' % self.codes.itemsize)]
+
+
+def new_column(field_type):
+    """
+    Get empty column suited to an Adwords field type.
+
+    :param field_type: fieldType as returned by ReportDefinitionService, or None for additional fields.
+    :return: NumericColumn or DictionaryColumn
+    """
+
+    if field_type in FLOAT_TYPES:
+        return NumericColumn('d')
+    elif field_type in INTEGER_TYPES:
+        return NumericColumn('l')
+    else:
+        return DictionaryColumn()
+
+
+class ColumnarTable(object):
+    """
+    Report held as typed columns instead of rows.
+
+    Money, Double, Long and Integer fields are stored in array.array, everything else is dictionary encoded.
+    """
+
+    def __init__(self, header, types, columns=None):
+        """
+        :param header: Column names.
+        :param types: Adwords field type per column, None for untyped columns.
+        :param columns: Existing columns, else empty columns are created from types.
+        """
+
+        self.header = list(header)
+        self.types = list(types)
+        self.columns = [new_column(x) for x in types] if columns is None else columns
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, name):
+        return self.columns[self.header.index(name)]
+
+    def append(self, row):
+        for column, value in zip(self.columns, row):
+            column.append(value)
+
+    def extend(self, rows):
+        appends = [x.append for x in self.columns]
+
+        for row in rows:
+            for append, value in zip(appends, row):
+                append(value)
+
+    def iter_rows(self):
+        """
+        :return: generator object for rows, decoded back to python values.
+        """
+
+        columns = self.columns
+        for index in xrange(len(self)):
+            yield [column[index] for column in columns]
+
+    def to_numpy(self):
+        """
+        Requires numpy.
+
+        :return: dictionary of column name to numpy array
+        """
+
+        assert np is not None, 'numpy is not installed'
+        return {name: column.to_numpy() for name, column in zip(self.header, self.columns)}
+
+
+def to_table(header, types, rows):
+    """
+    Load rows into a single ColumnarTable.
+
+    :param header: Column names.
+    :param types: Adwords field type per column.
+    :param rows: Iterable of cleaned rows without header.
+    :return: ColumnarTable
+    """
+
+    table = ColumnarTable(header, types)
+    table.extend(rows)
+    return table
+
+
+def iter_batches(header, types, rows, batch_size):
+    """
+    Load rows into ColumnarTables of at most batch_size rows, each with its own dictionaries.
+
+    :param header: Column names.
+    :param types: Adwords field type per column.
+    :param rows: Iterable of cleaned rows without header.
+    :param batch_size: Maximum rows per table.
+    :return: generator object for ColumnarTable
+    """
+
+    table = ColumnarTable(header, types)
+    appends = [x.append for x in table.columns]
+    count = 0
+
+    for row in rows:
+        for append, value in zip(appends, row):
+            append(value)
+        count += 1
+
+        if count == batch_size:
+            yield table
+
+            table = ColumnarTable(header, types)
+            appends = [x.append for x in table.columns]
+            count = 0
+
+    if count:
+        yield table
@@ -0,0 +1,127 @@
+from time import time
+
+from easyadwords.hierarchy import normalize_customer_id
+
+# ManagedCustomer fields fetched for a directory
+FIELDS = ['CustomerId', 'Name', 'CanManageClients', 'CurrencyCode', 'DateTimeZone', 'TestAccount', 'AccountLabels']
+
+
+class AccountDirectory(object):
+    """
+    Snapshot of the accounts and account labels under a manager account, as returned by list_accounts and
+    list_account_labels.
+
+    Accounts are indexed by customer id, and customer ids by label id and label name, so lookups do not scan the
+    account list. Index values are frozensets shared between calls.
+    """
+
+    def __init__(self, accounts, labels, fetched_at=None):
+        """
+        :param accounts: Serialized ManagedCustomer entries, including AccountLabels.
+        :param labels: Serialized AccountLabel entries.
+        :param fetched_at: time() of the fetch, defaults to now.
+        """
+
+        self.fetched_at = time() if fetched_at is None else fetched_at
+
+        self._labels = list(labels)
+        self._accounts = {}
+
+        by_id = {}
+        by_name = {}
+        clients_by_id = {}
+        clients_by_name = {}
+
+        for account in accounts:
+            customer_id = normalize_customer_id(account['customerId'])
+            self._accounts[customer_id] = account
+
+            for label in account.get('accountLabels', []):
+                by_id.setdefault(int(label['id']), set()).add(customer_id)
+                by_name.setdefault(label['name'], set()).add(customer_id)
+
+                if not account.get('canManageClients'):
+                    clients_by_id.setdefault(int(label['id']), set()).add(customer_id)
+                    clients_by_name.setdefault(label['name'], set()).add(customer_id)
+
+        # keyed by include_mcc
+        self._by_label_id = {
+            True: {k: frozenset(v) for k, v in by_id.iteritems()},
+            False: {k: frozenset(v) for k, v in clients_by_id.iteritems()}
+        }
+        self._by_label_name = {
+            True: {k: frozenset(v) for k, v in by_name.iteritems()},
+            False: {k: frozenset(v) for k, v in clients_by_name.iteritems()}
+        }
+
+        self._label_names = {int(x['id']): x['name'] for x in self._labels}
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def __contains__(self, client_customer_id):
+        return normalize_customer_id(client_customer_id) in self._accounts
+
+    def get(self, client_customer_id):
+        """
+        :return: serialized ManagedCustomer, or None if not in directory
+        """
+
+        return self._accounts.get(normalize_customer_id(client_customer_id))
+
+    def accounts(self, include_mcc=False):
+        """
+        :param include_mcc: Include manager accounts.
+        :return: list of serialized ManagedCustomer
+        """
+
+        return [x for x in self._accounts.itervalues() if include_mcc or not x.get('canManageClients')]
+
+    def labels(self):
+        """
+        :return: list of serialized AccountLabel, including labels no account has
+        """
+
+        return list(self._labels)
+
+    def label_name(self, label_id):
+        """
+        :return: name of a label, or None if not in directory
+        """
+
+        return self._label_names.get(int(label_id))
+
+    def by_label_id(self, label_id, include_mcc=False):
+        """
+        :param include_mcc: Include manager accounts.
+        :return: frozenset of customer ids of accounts with a label
+        """
+
+        return self._by_label_id[bool(include_mcc)].get(int(label_id), frozenset())
+
+    def by_label_name(self, label_name, include_mcc=False):
+        """
+        :param include_mcc: Include manager accounts.
+        :return: frozenset of customer ids of accounts with a label
+        """
+
+        return self._by_label_name[bool(include_mcc)].get(label_name, frozenset())
+
+    def by_label(self, label, include_mcc=False):
+        """
+        :param label: Label id (int or long) or label name (string).
+        :param include_mcc: Include manager accounts.
+        :return: frozenset of customer ids of accounts with a label
+        """
+
+        if isinstance(label, basestring):
+            return self.by_label_name(label, include_mcc)
+        else:
+            return self.by_label_id(label, include_mcc)
+
+    def is_expired(self, ttl):
+        """
+        :param ttl: Maximum age in seconds, None to never expire.
+        """
+
+        return ttl is not None and time() - self.fetched_at >= ttl
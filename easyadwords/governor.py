@@ -0,0 +1,222 @@
+from contextlib import contextmanager
+from threading import Condition, Lock
+from time import sleep, time
+
+from easyadwords.retry import is_rate_limit_error, is_server_error, retry_after
+
+
+class TokenBucket(object):
+    """
+    Thread safe token bucket, refilled continuously at rate tokens per second up to capacity.
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: Tokens added per second.
+        :param capacity: Maximum tokens held, ie. burst size. Defaults to one second worth of tokens.
+        """
+
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(rate, 1))
+
+        self._tokens = self.capacity
+        self._updated_at = time()
+        self._lock = Lock()
+
+    def acquire(self, tokens=1):
+        """
+        Take tokens, blocking until they are available.
+
+        :return: seconds spent waiting
+        """
+
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                now = time()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+
+                wait_time = (tokens - self._tokens) / self.rate
+
+            sleep(wait_time)
+            waited += wait_time
+
+
+class RateGovernor(object):
+    """
+    Shared limiter for AdWords API calls across threads.
+
+    Calls pass through a token bucket per developer token and one per customer, and the number of calls in flight is
+    capped by a limit adjusted AIMD style: it grows by one per limit successful calls and is multiplied by
+    decrease_factor on rate limit and server errors. A rate limit error also pauses all calls for the retryAfterSeconds
+    returned by AdWords (or rate_limit_pause), so threads back off together instead of each hammering the API.
+    Operations and report downloads are counted, see stats.
+    """
+
+    def __init__(self, developer_token_rate=None, customer_rate=None, max_concurrency=32, min_concurrency=1,
+                 decrease_factor=0.5, rate_limit_pause=30):
+        """
+        :param developer_token_rate: If set, maximum calls per second per developer token.
+        :param customer_rate: If set, maximum calls per second per client customer id.
+        :param max_concurrency: Upper bound, and initial value, of calls in flight.
+        :param min_concurrency: Lower bound of calls in flight.
+        :param decrease_factor: Multiplier applied to the concurrency limit on rate limit and server errors.
+        :param rate_limit_pause: Seconds to pause all calls after a rate limit error that does not state retryAfterSeconds.
+        """
+
+        self.developer_token_rate = developer_token_rate
+        self.customer_rate = customer_rate
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_factor = decrease_factor
+        self.rate_limit_pause = rate_limit_pause
+
+        self._limit = float(max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._condition = Condition()
+
+        self._buckets = {}
+        self._buckets_lock = Lock()
+
+        self._counters = {
+            'operations': 0,
+            'report_downloads': 0,
+            'rate_limit_errors': 0,
+            'server_errors': 0,
+            'throttled_seconds': 0.0
+        }
+        self._counters_lock = Lock()
+
+    def _bucket(self, key, rate):
+        with self._buckets_lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate)
+            return bucket
+
+    def _count(self, name, value=1):
+        with self._counters_lock:
+            self._counters[name] += value
+
+    @property
+    def concurrency_limit(self):
+        return int(self._limit)
+
+    def _enter(self):
+        waited = 0.0
+
+        with self._condition:
+            while True:
+                pause = self._paused_until - time()
+
+                if pause > 0:
+                    self._condition.wait(pause)
+                    waited += pause
+                elif self._in_flight >= int(self._limit):
+                    started = time()
+                    self._condition.wait(1)
+                    waited += time() - started
+                else:
+                    self._in_flight += 1
+                    return waited
+
+    def _exit(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def record_success(self):
+        with self._condition:
+            # additive increase, about one per limit successful calls
+            self._limit = min(self.max_concurrency, self._limit + 1.0 / self._limit)
+
+    def record_error(self, error):
+        rate_limited = is_rate_limit_error(error)
+
+        if not rate_limited and not is_server_error(error):
+            return
+
+        self._count('rate_limit_errors' if rate_limited else 'server_errors')
+
+        with self._condition:
+            # multiplicative decrease
+            self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+
+            if rate_limited:
+                pause = retry_after(error) or self.rate_limit_pause
+                self._paused_until = max(self._paused_until, time() + pause)
+
+    @contextmanager
+    def request(self, client_customer_id=None, developer_token=None, report=False):
+        """
+        Context manager wrapping a single API call.
+
+        :param client_customer_id: Customer the call is made for, limited by customer_rate.
+        :param developer_token: Developer token the call is made with, limited by developer_token_rate.
+        :param report: Count as report download instead of operation.
+        """
+
+        throttled = self._enter()
+
+        try:
+            if self.developer_token_rate is not None:
+                throttled += self._bucket(('developer_token', developer_token), self.developer_token_rate).acquire()
+
+            if self.customer_rate is not None and client_customer_id is not None:
+                throttled += self._bucket(('customer', str(client_customer_id)), self.customer_rate).acquire()
+
+            self._count('report_downloads' if report else 'operations')
+            self._count('throttled_seconds', throttled)
+
+            try:
+                yield
+            except Exception as e:
+                self.record_error(e)
+                raise
+            else:
+                self.record_success()
+        finally:
+            self._exit()
+
+    def stats(self):
+        """
+        :return: dictionary of counters and current concurrency limit
+        """
+
+        with self._counters_lock:
+            stats = dict(self._counters)
+
+        stats['concurrency_limit'] = self.concurrency_limit
+        stats['in_flight'] = self._in_flight
+        return stats
+
+
+class GovernedService(object):
+    """
+    Wraps a googleads service so every SOAP call goes through a RateGovernor.
+    """
+
+    def __init__(self, service, governor, client_customer_id=None, developer_token=None):
+        self._service = service
+        self._governor = governor
+        self._client_customer_id = client_customer_id
+        self._developer_token = developer_token
+
+    def __getattr__(self, attr):
+        method = getattr(self._service, attr)
+
+        if not callable(method):
+            return method
+
+        def governed(*args, **kwargs):
+            with self._governor.request(self._client_customer_id, self._developer_token):
+                return method(*args, **kwargs)
+
+        return governed
@@ -0,0 +1,189 @@
+from time import time
+
+from easyadwords.cache import read_json, write_json
+
+
+def normalize_customer_id(client_customer_id):
+    """
+    Convert a customer id such as '123-456-7890' or 1234567890 to int.
+    """
+
+    return int(str(client_customer_id).replace('-', ''))
+
+
+class AccountTree(object):
+    """
+    Accounts under a manager (MCC) account, linked as returned by ManagedCustomerService.
+
+    Accounts are serialized ManagedCustomer entries, indexed by customer id, parent, child and label name. An account
+    can be linked to more than one manager.
+    """
+
+    def __init__(self, root, accounts, links, crawled_at=None):
+        """
+        :param root: Customer id the tree was crawled from.
+        :param accounts: Serialized ManagedCustomer entries.
+        :param links: Serialized ManagedCustomerLink entries (managerCustomerId, clientCustomerId).
+        :param crawled_at: time() of the crawl, defaults to now.
+        """
+
+        self.root = normalize_customer_id(root)
+        self.crawled_at = time() if crawled_at is None else crawled_at
+
+        self._accounts = {}
+        for account in accounts:
+            self._accounts[normalize_customer_id(account['customerId'])] = account
+
+        self._links = []
+        self._children = {}
+        self._parents = {}
+
+        for link in links:
+            manager = normalize_customer_id(link['managerCustomerId'])
+            client = normalize_customer_id(link['clientCustomerId'])
+
+            # links to accounts filtered out of the crawl, eg. hidden ones, are dropped
+            if client not in self._accounts or manager in self._parents.get(client, ()):
+                continue
+
+            self._links.append(link)
+            self._children.setdefault(manager, []).append(client)
+            self._parents.setdefault(client, []).append(manager)
+
+        self._labels = {}
+        for customer_id, account in self._accounts.iteritems():
+            for label in account.get('accountLabels', []):
+                self._labels.setdefault(label['name'], []).append(customer_id)
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def __contains__(self, client_customer_id):
+        return normalize_customer_id(client_customer_id) in self._accounts
+
+    def get(self, client_customer_id):
+        """
+        :return: serialized ManagedCustomer, or None if not in tree
+        """
+
+        return self._accounts.get(normalize_customer_id(client_customer_id))
+
+    def children(self, client_customer_id):
+        """
+        :return: list of customer ids directly under an account
+        """
+
+        return list(self._children.get(normalize_customer_id(client_customer_id), []))
+
+    def parents(self, client_customer_id):
+        """
+        :return: list of customer ids of managers directly linked to an account
+        """
+
+        return list(self._parents.get(normalize_customer_id(client_customer_id), []))
+
+    def path(self, client_customer_id):
+        """
+        :return: list of customer ids from root to an account, following the first parent of each account
+        """
+
+        path = [normalize_customer_id(client_customer_id)]
+
+        while path[-1] != self.root and path[-1] in self._parents:
+            parent = self._parents[path[-1]][0]
+            if parent in path:
+                break
+            path.append(parent)
+
+        return path[::-1]
+
+    def descendants(self, client_customer_id=None, include_managers=False):
+        """
+        All accounts under an account, at any depth.
+
+        :param client_customer_id: Defaults to root.
+        :param include_managers: Include manager accounts, else only accounts that can not manage clients.
+        :return: list of customer ids
+        """
+
+        start = self.root if client_customer_id is None else normalize_customer_id(client_customer_id)
+
+        found = []
+        seen = set([start])
+        frontier = [start]
+
+        while frontier:
+            customer_id = frontier.pop()
+
+            for child in self._children.get(customer_id, []):
+                if child in seen:
+                    continue
+                seen.add(child)
+                frontier.append(child)
+
+                if include_managers or not self.is_manager(child):
+                    found.append(child)
+
+        return found
+
+    def is_manager(self, client_customer_id):
+        account = self.get(client_customer_id)
+        return bool(account and account.get('canManageClients'))
+
+    def managers(self):
+        """
+        :return: list of customer ids of manager accounts
+        """
+
+        return [x for x in self._accounts if self.is_manager(x)]
+
+    def labels(self):
+        """
+        :return: list of account label names in the tree
+        """
+
+        return list(self._labels)
+
+    def by_label(self, label_name):
+        """
+        :return: list of customer ids of accounts with an account label
+        """
+
+        return list(self._labels.get(label_name, []))
+
+    def is_expired(self, ttl):
+        """
+        :param ttl: Maximum age in seconds, None to never expire.
+        """
+
+        return ttl is not None and time() - self.crawled_at >= ttl
+
+    def to_dict(self):
+        return {
+            'root': self.root,
+            'crawled_at': self.crawled_at,
+            'accounts': self._accounts.values(),
+            'links': self._links
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['root'], data['accounts'], data['links'], data['crawled_at'])
+
+    def save(self, path):
+        """
+        Write tree to a JSON file atomically.
+        """
+
+        write_json(path, self.to_dict())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read tree written by save.
+
+        :return: AccountTree, or None if path does not exist or is corrupt
+        """
+
+        data = read_json(path)
+        return None if data is None else cls.from_dict(data)
@@ -0,0 +1,206 @@
+import logging
+from contextlib import contextmanager
+from threading import Lock
+from time import time
+
+logger = logging.getLogger('easyadwords')
+logger.addHandler(logging.NullHandler())
+
+
+class Instrumentation(object):
+    """
+    Hooks called by AdwordsUtility to report counters and timings. This base class only logs retries to the
+    'easyadwords' logger, subclass and override incr and timing to collect metrics.
+
+    Metrics reported:
+
+        report.request: seconds waiting for AdWords to start sending a report
+        report.download, report.bytes_downloaded: seconds reading and bytes read from report downloads
+        report.decompress, report.bytes_decompressed: seconds gunzipping and bytes gunzipped
+        report.parse: seconds splitting lines and parsing csv
+        report.clean: seconds cleaning rows
+        report.total, report.rows: seconds spent producing get_report rows, excluding the caller, and rows produced
+        service.page, service.pages, service.entries: seconds fetching pages, pages fetched and entries returned
+        retry.attempts, retry.backoff: retries made and seconds slept before them
+
+    Per-row stages are only metered when enabled is True.
+    """
+
+    enabled = False
+
+    def incr(self, name, value=1):
+        pass
+
+    def timing(self, name, seconds):
+        pass
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager reporting the time spent inside it as a timing, also when an exception is raised.
+        """
+
+        started = time()
+        try:
+            yield
+        finally:
+            self.timing(name, time() - started)
+
+    def retry(self, error, attempt, sleep_time):
+        logger.warning('Error encountered, sleeping for %.1fs. Attempt %d [%s]', sleep_time, attempt, error)
+
+        self.incr('retry.attempts')
+        self.timing('retry.backoff', sleep_time)
+
+
+class InMemoryCollector(Instrumentation):
+    """
+    Thread safe collector keeping counters and timing totals in memory, see snapshot.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._timings = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def timing(self, name, seconds):
+        with self._lock:
+            stats = self._timings.get(name)
+            if stats is None:
+                stats = self._timings[name] = [0, 0.0, 0.0]
+
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def snapshot(self):
+        """
+        :return: dictionary of counters, timings (count, total and max seconds per name) and rates (rows_per_second, bytes_per_second)
+        """
+
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {k: {'count': v[0], 'total': v[1], 'max': v[2]} for k, v in self._timings.iteritems()}
+
+        def rate(counter, timing):
+            seconds = timings.get(timing, {}).get('total')
+            return counters[counter] / seconds if counter in counters and seconds else None
+
+        return {
+            'counters': counters,
+            'timings': timings,
+            'rates': {
+                'rows_per_second': rate('report.rows', 'report.total'),
+                'bytes_per_second': rate('report.bytes_downloaded', 'report.download')
+            }
+        }
+
+
+class LoggingCollector(Instrumentation):
+    """
+    Logs every counter and timing as it is reported.
+    """
+
+    enabled = True
+
+    def __init__(self, log=None, level=logging.INFO):
+        """
+        :param log: Logger to write to, defaults to the 'easyadwords' logger.
+        :param level: Level counters and timings are logged at. Retries are always logged as warnings.
+        """
+
+        self.log = logger if log is None else log
+        self.level = level
+
+    def incr(self, name, value=1):
+        self.log.log(self.level, '%s +%s', name, value)
+
+    def timing(self, name, seconds):
+        self.log.log(self.level, '%s %.3fs', name, seconds)
+
+
+class MeteredStream(object):
+    """
+    File-like wrapper counting bytes and seconds spent in read.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def read(self, size=-1):
+        started = time()
+        try:
+            data = self.stream.read(size)
+        finally:
+            self.seconds += time() - started
+
+        self.bytes += len(data)
+        return data
+
+    def close(self):
+        self.stream.close()
+
+
+class MeteredIterator(object):
+    """
+    Iterator wrapper counting items, and bytes if items are strings, and seconds spent producing them.
+    """
+
+    def __init__(self, iterable, count_bytes=False):
+        self._iterator = iter(iterable)
+        self._count_bytes = count_bytes
+        self.items = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        started = time()
+        try:
+            item = next(self._iterator)
+        finally:
+            self.seconds += time() - started
+
+        self.items += 1
+        if self._count_bytes:
+            self.bytes += len(item)
+        return item
+
+
+class _InstrumentedDownload(MeteredStream):
+    # reports download metrics once the report stream is closed
+
+    def __init__(self, stream, instrumentation):
+        super(_InstrumentedDownload, self).__init__(stream)
+        self._instrumentation = instrumentation
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self._instrumentation.timing('report.download', self.seconds)
+            self._instrumentation.incr('report.bytes_downloaded', self.bytes)
+
+
+def instrument_download(stream, instrumentation):
+    """
+    Wrap a report download stream so report.download and report.bytes_downloaded are reported when it is closed.
+    """
+
+    if not instrumentation.enabled:
+        return stream
+    return _InstrumentedDownload(stream, instrumentation)
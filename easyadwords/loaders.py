@@ -0,0 +1,134 @@
+import sys
+
+from easyadwords.utils import prefetch
+
+
+def _placeholders(paramstyle, count):
+    if paramstyle == 'qmark':
+        return ['?'] * count
+    elif paramstyle == 'numeric':
+        return [':%d' % (i + 1) for i in range(count)]
+    elif paramstyle == 'named':
+        return [':c%d' % i for i in range(count)]
+    elif paramstyle in ('format', 'pyformat'):
+        # pyformat drivers accept %s as well
+        return ['%s'] * count
+    else:
+        raise ValueError('Unsupported paramstyle %s' % paramstyle)
+
+
+def get_paramstyle(connection, default='qmark'):
+    """
+    Get the DB-API paramstyle of the module a connection comes from, eg. qmark for sqlite3, pyformat for psycopg2.
+
+    :param connection: DB-API connection.
+    :param default: Returned if the module does not declare a paramstyle.
+    """
+
+    module = sys.modules.get(type(connection).__module__.split('.')[0])
+    return getattr(module, 'paramstyle', default)
+
+
+def insert_statement(table, columns, paramstyle='qmark'):
+    """
+    Build an INSERT statement for executemany. Table and column names are used as is.
+
+    :param table: Table name.
+    :param columns: Column names, in the order of the values of each row.
+    :param paramstyle: DB-API paramstyle of the connection's module.
+    :return: SQL string
+    """
+
+    return 'INSERT INTO %s (%s) VALUES (%s)' % (
+        table,
+        ', '.join(columns),
+        ', '.join(_placeholders(paramstyle, len(columns)))
+    )
+
+
+def iter_batches(rows, batch_size):
+    """
+    Group an iterable of rows into lists of at most batch_size rows.
+
+    :return: generator object for lists of rows
+    """
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def load_report(report, connection, table, columns=None, batch_size=5000, pipeline=False, pipeline_batches=2,
+                paramstyle=None, commit=True):
+    """
+    Insert the rows of a report into a database table with one executemany call per batch.
+
+    Column names are taken from the report header, ie. the aliases of fields and additional fields passed to
+    get_report, unless renamed by columns.
+
+    :param report: Generator from get_report, header first.
+    :param connection: DB-API connection, only used from the calling thread.
+    :param table: Table to insert into.
+    :param columns: Dictionary of header name to table column. If set, only these columns are inserted.
+    :type columns: dict
+    :param batch_size: Rows per executemany call.
+    :param pipeline: Download and clean the next batches on a background thread while the current one is inserted.
+    :param pipeline_batches: With pipeline, number of batches prepared ahead of the insert.
+    :param paramstyle: DB-API paramstyle of the connection's module. Defaults to the one declared by the module.
+    :param commit: Commit once all rows are inserted.
+    :return: number of rows inserted
+    """
+
+    header = next(report)
+
+    if columns is None:
+        indexes = None
+        table_columns = header
+    else:
+        assert isinstance(columns, dict)
+        assert all(x in header for x in columns), 'columns not in report header: %s' % [
+            x for x in columns if x not in header
+        ]
+
+        # keep report column order
+        indexes = [i for i, x in enumerate(header) if x in columns]
+        table_columns = [columns[header[i]] for i in indexes]
+
+    if paramstyle is None:
+        paramstyle = get_paramstyle(connection)
+
+    statement = insert_statement(table, table_columns, paramstyle)
+
+    if indexes is not None:
+        report = ([row[i] for i in indexes] for row in report)
+
+    if paramstyle == 'named':
+        names = ['c%d' % i for i in range(len(table_columns))]
+        report = (dict(zip(names, row)) for row in report)
+
+    batches = iter_batches(report, batch_size)
+    if pipeline:
+        batches = prefetch(batches, pipeline_batches)
+
+    count = 0
+    cursor = connection.cursor()
+    try:
+        for batch in batches:
+            cursor.executemany(statement, batch)
+            count += len(batch)
+    finally:
+        # stops the pipeline thread if an insert failed
+        batches.close()
+        cursor.close()
+
+    if commit:
+        connection.commit()
+
+    return count
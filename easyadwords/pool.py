@@ -0,0 +1,343 @@
+import copy
+from collections import OrderedDict
+import errno
+import httplib
+import socket
+import urllib
+import urllib2
+from threading import Lock, RLock, local
+from time import time
+
+
+class LockedOAuth2Client(object):
+    """
+    Wraps a googleads GoogleOAuth2Client so concurrent threads refresh the shared access token one at a time.
+    """
+
+    def __init__(self, oauth2_client):
+        self._oauth2_client = oauth2_client
+        self._lock = RLock()
+
+    def CreateHttpHeader(self):
+        with self._lock:
+            return self._oauth2_client.CreateHttpHeader()
+
+    def Refresh(self):
+        with self._lock:
+            return self._oauth2_client.Refresh()
+
+    def __getattr__(self, attr):
+        return getattr(self._oauth2_client, attr)
+
+
+class ConnectionPool(object):
+    """
+    Idle keep-alive HTTPS connections per host, shared by all threads. A connection is only used by one request at a
+    time and returned once its response has been read to the end.
+    """
+
+    def __init__(self, max_idle=10, idle_timeout=60):
+        """
+        :param max_idle: Idle connections kept per host, others are closed.
+        :param idle_timeout: Seconds an idle connection is kept, servers close them after a while.
+        """
+
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+
+        self._idle = {}
+        self._lock = Lock()
+
+    def get(self, host):
+        """
+        :return: idle httplib.HTTPSConnection, or None
+        """
+
+        with self._lock:
+            connections = self._idle.get(host)
+
+            while connections:
+                released_at, connection = connections.pop()
+
+                if time() - released_at < self.idle_timeout:
+                    return connection
+                connection.close()
+
+        return None
+
+    def put(self, host, connection):
+        with self._lock:
+            connections = self._idle.setdefault(host, [])
+
+            if len(connections) < self.max_idle:
+                connections.append((time(), connection))
+                return
+
+        connection.close()
+
+    def clear(self):
+        """
+        Close all idle connections.
+        """
+
+        with self._lock:
+            idle, self._idle = self._idle, {}
+
+        for connections in idle.itervalues():
+            for _, connection in connections:
+                connection.close()
+
+
+class _PooledSocket(object):
+    # read end of a response for socket._fileobject, returns the connection to the pool once the response is read
+
+    def __init__(self, pool, host, connection, response):
+        self._pool = pool
+        self._host = host
+        self._connection = connection
+        self._response = response
+
+    def recv(self, size):
+        data = self._response.read(size)
+
+        # httplib closes a response once its content length or last chunk is read
+        if self._response.isclosed():
+            self._release()
+
+        return data
+
+    def _release(self):
+        connection, self._connection = self._connection, None
+
+        if connection is not None:
+            if self._response.will_close:
+                connection.close()
+            else:
+                self._pool.put(self._host, connection)
+
+    def close(self):
+        # closed before the end of the response, the connection can not be reused
+        if self._connection is not None:
+            self._response.close()
+            self._connection.close()
+            self._connection = None
+
+
+class KeepAliveHTTPSHandler(urllib2.HTTPSHandler):
+    """
+    urllib2 handler sending HTTPS requests over connections from a ConnectionPool instead of a new connection (and TLS
+    handshake) per request. Requests tunnelled through a proxy are sent as by urllib2.HTTPSHandler.
+    """
+
+    def __init__(self, pool, context=None):
+        urllib2.HTTPSHandler.__init__(self, context=context)
+        self._pool = pool
+
+    @staticmethod
+    def _request(connection, req, headers, timeout):
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+
+        connection.request(req.get_method(), req.get_selector(), req.data, headers)
+
+    @staticmethod
+    def _closed_while_idle(e):
+        # the server closed the connection before reading the request, eg. after its keep-alive timeout. A timeout or
+        # any other failure may come after the server processed the request, which must not be sent twice
+        if isinstance(e, socket.timeout):
+            return False
+        if isinstance(e, httplib.BadStatusLine):
+            # httplib sets line to repr('') when the connection closed without a status line
+            return e.line in ('', "''")
+        if isinstance(e, socket.error):
+            return e.errno in (errno.ECONNRESET, errno.EPIPE)
+        return False
+
+    def https_open(self, req):
+        if req._tunnel_host:
+            return urllib2.HTTPSHandler.https_open(self, req)
+
+        host = req.get_host()
+        timeout = socket.getdefaulttimeout() if req.timeout is socket._GLOBAL_DEFAULT_TIMEOUT else req.timeout
+
+        # as urllib2.AbstractHTTPHandler.do_open, without Connection: close
+        headers = dict(req.unredirected_hdrs)
+        headers.update((k, v) for k, v in req.headers.items() if k not in headers)
+        headers = dict((k.title(), v) for k, v in headers.items())
+        headers['Connection'] = 'keep-alive'
+
+        response = None
+        connection = self._pool.get(host)
+
+        if connection is not None:
+            try:
+                self._request(connection, req, headers, timeout)
+                response = connection.getresponse(buffering=True)
+            except (socket.error, httplib.HTTPException) as e:
+                connection.close()
+
+                # only resend a request the server never read
+                if not self._closed_while_idle(e):
+                    raise urllib2.URLError(e)
+
+        if response is None:
+            connection = httplib.HTTPSConnection(host, timeout=timeout, context=self._context)
+            try:
+                self._request(connection, req, headers, timeout)
+                response = connection.getresponse(buffering=True)
+            except socket.error as e:
+                connection.close()
+                raise urllib2.URLError(e)
+
+        fp = socket._fileobject(_PooledSocket(self._pool, host, connection, response), close=True)
+
+        resp = urllib.addinfourl(fp, response.msg, req.get_full_url())
+        resp.code = response.status
+        resp.msg = response.reason
+        return resp
+
+
+class KeepAliveProxyConfig(object):
+    """
+    Wraps a googleads ProxyConfig so suds transports and report downloaders built from it send requests through a
+    KeepAliveHTTPSHandler sharing one ConnectionPool.
+    """
+
+    def __init__(self, proxy_config, pool=None):
+        self._proxy_config = proxy_config
+        self.connection_pool = ConnectionPool() if pool is None else pool
+
+    def GetHandlers(self):
+        handlers = self._proxy_config.GetHandlers()
+
+        # keep the SSL context of the configured handler
+        context = None
+        for handler in handlers:
+            if isinstance(handler, urllib2.HTTPSHandler):
+                context = handler._context
+
+        return [KeepAliveHTTPSHandler(self.connection_pool, context)] + [
+            x for x in handlers if not isinstance(x, urllib2.HTTPSHandler)
+        ]
+
+    def GetSudsProxyTransport(self):
+        return self._proxy_config._SudsProxyTransport(self.GetHandlers())
+
+    def __getattr__(self, attr):
+        return getattr(self._proxy_config, attr)
+
+
+class ServiceCache(object):
+    """
+    Per-thread cache of service objects and report downloaders, keyed by eg. (service name, version, customer id).
+
+    Building one parses WSDL/XSD, and suds services set SOAP headers on their client before every call, so objects are
+    reused by the thread that built them instead of being shared. Each thread keeps its max_size most recently used
+    objects, so long lived threads going through many customers do not keep one object per customer.
+    """
+
+    def __init__(self, max_size=32):
+        """
+        :param max_size: Objects kept per thread.
+        """
+
+        self.max_size = max_size
+
+        self._local = local()
+        self._generation = 0
+        self._lock = Lock()
+
+    def get(self, key, factory):
+        """
+        :param key: Hashable key.
+        :param factory: Function returning a new object if key is not cached for this thread.
+        """
+
+        objects = getattr(self._local, 'objects', None)
+
+        if objects is None or self._local.generation != self._generation:
+            objects = self._local.objects = OrderedDict()
+            self._local.generation = self._generation
+
+        try:
+            # move to the end as most recently used
+            value = objects.pop(key)
+        except KeyError:
+            value = factory()
+
+            if len(objects) >= self.max_size:
+                objects.popitem(last=False)
+
+        objects[key] = value
+        return value
+
+    def clear(self):
+        """
+        Drop cached objects of all threads.
+        """
+
+        with self._lock:
+            self._generation += 1
+
+
+class ClientPool(object):
+    """
+    Hands out per-customer views of a single AdWordsClient.
+
+    Views are shallow copies of the loaded client with their own client_customer_id. They share the OAuth2 client
+    (and its cached access token), proxy configuration and suds cache, so no view re-runs LoadFromStorage and each
+    thread can query its own customer without mutating the shared client.
+
+    The shared client is itself a shallow copy, the client passed in keeps its own OAuth2 client and proxy
+    configuration.
+    """
+
+    def __init__(self, client, keep_alive=False):
+        """
+        :param client: Loaded googleads AdWordsClient, not modified.
+        :param keep_alive: Send requests of all views over a shared pool of keep-alive connections.
+        """
+
+        client = copy.copy(client)
+
+        if not isinstance(client.oauth2_client, LockedOAuth2Client):
+            client.oauth2_client = LockedOAuth2Client(client.oauth2_client)
+
+        proxy_config = getattr(client, 'proxy_config', None)
+        if keep_alive and proxy_config is not None and not isinstance(proxy_config, KeepAliveProxyConfig):
+            client.proxy_config = KeepAliveProxyConfig(proxy_config)
+
+        self._client = client
+        self._views = {}
+        self._lock = Lock()
+
+    def get(self, client_customer_id=None):
+        """
+        Get client for customer.
+
+        :param client_customer_id: If None, the shared client is returned as is.
+        :return: googleads AdWordsClient
+        """
+
+        if client_customer_id is None:
+            return self._client
+
+        client_customer_id = str(client_customer_id)
+
+        with self._lock:
+            view = self._views.get(client_customer_id)
+
+            if view is None:
+                view = copy.copy(self._client)
+                view.SetClientCustomerId(client_customer_id)
+                self._views[client_customer_id] = view
+
+            return view
+
+    def clear(self):
+        """
+        Drop all customer views.
+        """
+
+        with self._lock:
+            self._views.clear()
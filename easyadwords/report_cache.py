@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from threading import Lock
+from time import time
+
+from easyadwords.utils import copy_gzip
+
+
+class ReportCache(object):
+    """
+    Local cache of downloaded reports, one file per account, report definition and day.
+
+    Files hold the report exactly as downloaded (GZIPPED_CSV without headers or summary) and are cleaned when read,
+    so custom cleaning and additional fields can change between calls without invalidating the cache.
+
+    Layout: directory/client_customer_id/report_type/definition hash/YYYYMMDD.csv.gz
+    """
+
+    SUFFIX = '.csv.gz'
+
+    def __init__(self, directory, stale_days=3, max_bytes=None, max_age=None):
+        """
+        :param directory: Directory to store reports in.
+        :param stale_days: Days up to and including today that are always downloaded again, as they can still change.
+        :param max_bytes: If set, evict least recently downloaded days once the cache is larger than this.
+        :param max_age: If set, evict days downloaded more than this many seconds ago.
+        """
+
+        self.directory = directory
+        self.stale_days = stale_days
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._lock = Lock()
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @staticmethod
+    def key(client_customer_id, report_type, field_names, predicates=None, include_zero_impressions=False,
+            service_version=None):
+        """
+        Get cache key for a report definition.
+
+        :return: key to pass to get, write and path
+        """
+
+        definition = json.dumps(
+            [list(field_names), predicates or [], bool(include_zero_impressions), service_version],
+            sort_keys=True,
+            default=str
+        )
+
+        return os.path.join(
+            str(client_customer_id).replace('-', ''),
+            report_type,
+            hashlib.sha1(definition).hexdigest()[:16]
+        )
+
+    def path(self, key, date):
+        return os.path.join(self.directory, key, date.strftime('%Y%m%d') + self.SUFFIX)
+
+    def is_stale(self, date):
+        """
+        Whether a report day can still change and should be downloaded again.
+
+        :type date: datetime
+        """
+
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return date > today - timedelta(self.stale_days)
+
+    def get(self, key, date):
+        """
+        Get path to a cached report day.
+
+        :return: path, or None if not cached, stale or expired.
+        """
+
+        if self.is_stale(date):
+            return None
+
+        path = self.path(key, date)
+
+        try:
+            downloaded_at = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        if self.max_age is not None and time() - downloaded_at > self.max_age:
+            return None
+
+        return path
+
+    def write(self, key, date, stream, chunk_size=1024 * 16, decompressed=None):
+        """
+        Copy a report download stream into the cache. The file only appears once the download is complete and
+        decompresses to the end.
+
+        :param decompressed: File-like object to also write the decompressed report to, eg. to parse it without decompressing the cached file again.
+        :return: path to cached report day
+        """
+
+        path = self.path(key, date)
+        directory = os.path.dirname(path)
+
+        with self._lock:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                copy_gzip(stream, f, chunk_size, decompressed)
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+        return path
+
+    def _iter_files(self):
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith(self.SUFFIX):
+                    yield os.path.join(root, filename)
+
+    def invalidate(self, client_customer_id=None, report_type=None, start_date=None, end_date=None):
+        """
+        Remove cached report days. With no arguments, the whole cache is cleared.
+
+        :param client_customer_id: Only remove reports of this account.
+        :param report_type: Only remove reports of this type.
+        :param start_date: Only remove days on or after this date.
+        :type start_date: datetime
+        :param end_date: Only remove days on or before this date.
+        :type end_date: datetime
+        """
+
+        for path in list(self._iter_files()):
+            customer, report, _, filename = os.path.relpath(path, self.directory).split(os.sep)
+            date = datetime.strptime(filename[:-len(self.SUFFIX)], '%Y%m%d')
+
+            if client_customer_id is not None and customer != str(client_customer_id).replace('-', ''):
+                continue
+            if report_type is not None and report != report_type:
+                continue
+            if start_date is not None and date < start_date.replace(hour=0, minute=0, second=0, microsecond=0):
+                continue
+            if end_date is not None and date > end_date:
+                continue
+
+            os.remove(path)
+
+    def evict(self):
+        """
+        Remove days older than max_age, then the least recently downloaded days until under max_bytes.
+        """
+
+        if self.max_age is None and self.max_bytes is None:
+            return
+
+        files = []
+        for path in self._iter_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        now = time()
+        total_bytes = sum(x[1] for x in files)
+
+        for downloaded_at, size, path in sorted(files):
+            expired = self.max_age is not None and now - downloaded_at > self.max_age
+            oversized = self.max_bytes is not None and total_bytes > self.max_bytes
+
+            if not expired and not oversized:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
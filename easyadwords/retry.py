@@ -0,0 +1,161 @@
+import random
+import re
+import socket
+from functools import wraps
+from httplib import HTTPException
+from time import sleep, time
+
+from googleads.errors import AdWordsReportError
+from urllib2 import URLError
+
+from easyadwords.instrumentation import Instrumentation
+from easyadwords.utils import TruncatedGzipError
+
+
+_RETRY_AFTER = re.compile(r'retryAfterSeconds\W*(\d+)')
+
+
+def _error_text(error):
+    # report errors carry the response body in content, SOAP faults in their message
+    return '%s %s' % (error, getattr(error, 'content', '') or '')
+
+
+def is_rate_limit_error(error):
+    """
+    Whether error is an AdWords RateExceededError, from a SOAP call or a report download.
+    """
+
+    if getattr(error, 'code', None) == 429:
+        return True
+
+    text = _error_text(error)
+    return 'RateExceeded' in text or 'RATE_EXCEEDED' in text
+
+
+def is_server_error(error):
+    """
+    Whether error is a 5xx response or an AdWords internal error.
+    """
+
+    code = getattr(error, 'code', None)
+    if isinstance(code, int) and code >= 500:
+        return True
+
+    text = _error_text(error)
+    return 'InternalApiError' in text or 'UNEXPECTED_INTERNAL_API_ERROR' in text
+
+
+def retry_after(error):
+    """
+    Get seconds AdWords asked to wait from a RateExceededError, or None if not stated.
+    """
+
+    match = _RETRY_AFTER.search(_error_text(error))
+    return int(match.group(1)) if match else None
+
+
+class RetryPolicy(object):
+    """
+    Retry with jittered exponential backoff, limited by number of attempts and optionally by total time.
+
+    The n-th retry sleeps for a random time between half and all of min(max_delay, delay * backoff ** (n - 1)).
+    """
+
+    def __init__(self, retries=3, delay=3, backoff=2, max_delay=60, budget=None, instrumentation=None):
+        """
+        :param retries: Maximum attempts, including the first.
+        :param delay: Base sleep in seconds before the first retry.
+        :param backoff: Multiplier applied to the sleep for each further retry.
+        :param max_delay: Upper bound of a single sleep in seconds.
+        :param budget: If set, give up once the next retry would start more than this many seconds after the first attempt.
+        :param instrumentation: Instrumentation notified of every retry, defaults to logging retries as warnings.
+        """
+
+        self.retries = retries
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.budget = budget
+        self.instrumentation = Instrumentation() if instrumentation is None else instrumentation
+
+    @staticmethod
+    def is_retryable(error):
+        """
+        Server and rate limit errors, and network errors, including connections dropped mid-download and reports cut
+        short.
+        """
+
+        if is_rate_limit_error(error) or is_server_error(error):
+            return True
+
+        if isinstance(error, AdWordsReportError):
+            return False
+
+        return isinstance(error, (URLError, socket.error, HTTPException, TruncatedGzipError))
+
+    def next_delay(self, error, attempt, started):
+        """
+        Get seconds to sleep before retrying after a failed attempt.
+
+        :param error: Exception raised by the attempt.
+        :param attempt: Number of the failed attempt, starting at 1.
+        :param started: time() of the first attempt.
+        :return: seconds to sleep, or None to give up.
+        """
+
+        if attempt >= self.retries or not self.is_retryable(error):
+            return None
+
+        sleep_time = min(self.max_delay, self.delay * self.backoff ** (attempt - 1))
+        sleep_time = random.uniform(sleep_time / 2.0, sleep_time)
+
+        # never retry sooner than AdWords asked to
+        sleep_time = max(sleep_time, retry_after(error) or 0)
+
+        if self.budget is not None and time() + sleep_time - started > self.budget:
+            return None
+
+        return sleep_time
+
+    def wait(self, error, attempt, sleep_time):
+        self.instrumentation.retry(error, attempt, sleep_time)
+        sleep(sleep_time)
+
+    def call(self, f, *args, **kwargs):
+        """
+        Call f, retrying according to this policy.
+        """
+
+        attempt = 0
+        started = time()
+
+        while True:
+            attempt += 1
+
+            try:
+                return f(*args, **kwargs)
+            except Exception as e:
+                sleep_time = self.next_delay(e, attempt, started)
+                if sleep_time is None:
+                    raise
+
+                self.wait(e, attempt, sleep_time)
+
+
+def retry(retries=3, delay=3, backoff=2):
+    """
+    Decorator retrying a method with the RetryPolicy of its object (_retry_policy), or one built from these arguments.
+
+    **NOTE** Generators are only retried while being created, consume them inside the decorated function.
+    """
+
+    default_policy = RetryPolicy(retries, delay, backoff)
+
+    def deco_retry(f):
+        @wraps(f)
+        def f_retry(*args, **kwargs):
+            policy = getattr(args[0], '_retry_policy', default_policy)
+            return policy.call(f, *args, **kwargs)
+
+        return f_retry  # true decorator
+    return deco_retry
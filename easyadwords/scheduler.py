@@ -0,0 +1,333 @@
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+from time import time
+
+from easyadwords.instrumentation import logger
+from easyadwords.utils import date_windows
+from easyadwords.writers import write_csv
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    client_customer_id TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    weight REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    finished_at REAL,
+    UNIQUE (client_customer_id, spec, start_date, end_date)
+);
+CREATE INDEX IF NOT EXISTS units_status ON units (status, weight);
+"""
+
+_DATE_FORMAT = '%Y-%m-%d'
+
+
+def csv_handler(directory):
+    """
+    Handler for BackfillScheduler.run writing each unit to <directory>/<spec>/<customer id>_<start>_<end>.csv.
+
+    Files are written to a temporary name and renamed once complete, so a crash never leaves a partial file behind
+    under the final name.
+
+    :return: function returning {'path': ..., 'rows': ...} per unit
+    """
+
+    def handle(unit, report):
+        spec_directory = os.path.join(directory, unit['spec'])
+        if not os.path.isdir(spec_directory):
+            try:
+                os.makedirs(spec_directory)
+            except OSError:
+                # created by another thread
+                if not os.path.isdir(spec_directory):
+                    raise
+
+        path = os.path.join(spec_directory, '%s_%s_%s.csv' % (
+            unit['client_customer_id'],
+            unit['start_date'].strftime('%Y%m%d'),
+            unit['end_date'].strftime('%Y%m%d')
+        ))
+
+        fd, temp_path = tempfile.mkstemp(dir=spec_directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                rows = write_csv(report, f)
+            os.rename(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        return {'path': path, 'rows': rows - 1}
+
+    return handle
+
+
+class BackfillScheduler(object):
+    """
+    Persistent queue of report downloads over accounts x report specs x date windows, stored in a SQLite file.
+
+    plan expands the work into units, one get_report call each, and run works through pending units on a thread pool,
+    largest first. Each unit is checkpointed as soon as it completes, so a crashed or interrupted run resumes where it
+    stopped when run again, and planning the same work twice adds nothing.
+
+    Report specs are passed in by code rather than stored, as fields may hold cleaning functions:
+
+        specs = {
+            'campaigns': {
+                'report_type': 'CAMPAIGN_PERFORMANCE_REPORT',
+                'fields': [{'name': 'Date'}, {'name': 'CampaignId'}, {'name': 'Cost'}],
+                'weight': 1
+            }
+        }
+
+    Spec keys other than report_type and fields (additional_fields, predicates, include_zero_impressions) are passed on
+    to get_report. weight is the relative cost of a day of the report, eg. higher for keyword reports.
+    """
+
+    def __init__(self, path, specs):
+        """
+        :param path: SQLite file of the queue, created if missing.
+        :param specs: Dictionary of spec name to report spec.
+        :type specs: dict
+        """
+
+        assert all('report_type' in x and 'fields' in x for x in specs.itervalues())
+
+        self.path = path
+        self.specs = specs
+
+        # only used from the thread running plan, run and progress
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+
+        self._started_at = None
+        self._weight_done = 0.0
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def plan(self, client_customer_ids, start_date, end_date, specs=None, window_days=7, account_weights=None):
+        """
+        Add units for every account, spec and date window. Units already planned, done or not, are left as they are.
+
+        :param client_customer_ids: Accounts to download reports for.
+        :param start_date: First day.
+        :param end_date: Last day.
+        :param specs: Spec names to plan, defaults to all specs.
+        :param window_days: Days per unit.
+        :param account_weights: Dictionary of customer id to relative size of the account, eg. impressions from an AccountActivityIndex. Accounts not listed weigh 1.
+        :return: number of units added
+        """
+
+        specs = sorted(self.specs) if specs is None else specs
+        account_weights = {} if account_weights is None else account_weights
+        windows = list(date_windows(start_date, end_date, window_days))
+
+        units = []
+        for client_customer_id in client_customer_ids:
+            account_weight = account_weights.get(client_customer_id, 1)
+
+            for spec in specs:
+                spec_weight = self.specs[spec].get('weight', 1)
+
+                for window_start, window_end in windows:
+                    units.append((
+                        str(client_customer_id),
+                        spec,
+                        window_start.strftime(_DATE_FORMAT),
+                        window_end.strftime(_DATE_FORMAT),
+                        ((window_end - window_start).days + 1) * account_weight * spec_weight
+                    ))
+
+        with self._connection:
+            before = self._connection.total_changes
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO units (client_customer_id, spec, start_date, end_date, weight) '
+                'VALUES (?, ?, ?, ?, ?)',
+                units
+            )
+            return self._connection.total_changes - before
+
+    def _pending(self, max_attempts):
+        # units left pending by a run allowing more attempts are failed under this one, so they are not counted as
+        # pending and retry_failed picks them up
+        with self._connection:
+            self._connection.execute(
+                'UPDATE units SET status = ? WHERE status = ? AND attempts >= ?',
+                ('failed', 'pending', max_attempts)
+            )
+
+        cursor = self._connection.execute(
+            'SELECT id, client_customer_id, spec, start_date, end_date, weight FROM units '
+            'WHERE status = ? AND attempts < ? ORDER BY weight DESC, id',
+            ('pending', max_attempts)
+        )
+
+        return [
+            {
+                'id': unit_id,
+                'client_customer_id': client_customer_id,
+                'spec': spec,
+                'start_date': datetime.strptime(start, _DATE_FORMAT),
+                'end_date': datetime.strptime(end, _DATE_FORMAT),
+                'weight': weight
+            }
+            for unit_id, client_customer_id, spec, start, end, weight in cursor
+        ]
+
+    def _run_unit(self, utility, handler, unit):
+        spec = self.specs[unit['spec']]
+
+        try:
+            report = utility.get_report(
+                unit['start_date'],
+                unit['end_date'],
+                spec['report_type'],
+                # get_report fills in field types, give each unit its own copy
+                [dict(x) for x in spec['fields']],
+                additional_fields=spec.get('additional_fields'),
+                predicates=spec.get('predicates'),
+                client_customer_id=unit['client_customer_id'],
+                include_zero_impressions=spec.get('include_zero_impressions', False)
+            )
+
+            return unit, handler(unit, report), None
+        except Exception as e:
+            return unit, None, '%s: %s' % (type(e).__name__, e)
+
+    def _record(self, unit, result, error, max_attempts):
+        with self._connection:
+            if error is None:
+                self._connection.execute(
+                    'UPDATE units SET status = ?, attempts = attempts + 1, result = ?, error = NULL, finished_at = ? '
+                    'WHERE id = ?',
+                    ('done', json.dumps(result), time(), unit['id'])
+                )
+            else:
+                self._connection.execute(
+                    'UPDATE units SET status = CASE WHEN attempts + 1 >= ? THEN ? ELSE status END, '
+                    'attempts = attempts + 1, error = ? WHERE id = ?',
+                    (max_attempts, 'failed', error, unit['id'])
+                )
+
+    def run(self, utility, handler, max_workers=4, max_attempts=2, progress=None):
+        """
+        Run pending units until none are left, largest weight first.
+
+        A unit that raises is retried up to max_attempts times over this and later runs, then marked failed, see
+        retry_failed. Pending units already at max_attempts, eg. from a run allowing more attempts, are marked failed
+        too. Interrupting a run leaves unfinished units pending.
+
+        :param utility: AdwordsUtility to download reports with.
+        :type utility: easyadwords.adwords.AdwordsUtility
+        :param handler: Function of (unit, report) consuming the get_report generator, eg. csv_handler or a function around load_report. Called from worker threads. The JSON serializable value it returns is stored as the unit's result.
+        :param max_workers: Maximum number of units running at once.
+        :param max_attempts: Attempts per unit before it is marked failed.
+        :param progress: Function called with progress() after each unit completes.
+        :return: progress()
+        """
+
+        self._started_at = time()
+        self._weight_done = 0.0
+
+        pool = ThreadPool(max_workers)
+        try:
+            while True:
+                units = self._pending(max_attempts)
+                if not units:
+                    break
+
+                # imap_unordered hands out units in order, so the largest start first
+                for unit, result, error in pool.imap_unordered(
+                        lambda x: self._run_unit(utility, handler, x), units):
+                    self._record(unit, result, error, max_attempts)
+
+                    if error is None:
+                        self._weight_done += unit['weight']
+                    else:
+                        logger.warning(
+                            'Backfill unit %s %s %s-%s failed: %s',
+                            unit['client_customer_id'],
+                            unit['spec'],
+                            unit['start_date'].strftime(_DATE_FORMAT),
+                            unit['end_date'].strftime(_DATE_FORMAT),
+                            error
+                        )
+
+                    if progress is not None:
+                        progress(self.progress())
+        finally:
+            pool.terminate()
+
+        return self.progress()
+
+    def progress(self):
+        """
+        Count units by status. During or after run, eta_seconds estimates the time left from the weight completed per
+        second so far.
+
+        :return: dictionary of total, pending, done, failed, weight_total, weight_done, elapsed_seconds and eta_seconds (None if unknown)
+        """
+
+        counts = {'pending': 0, 'done': 0, 'failed': 0}
+        weights = {'pending': 0.0, 'done': 0.0, 'failed': 0.0}
+
+        for status, count, weight in self._connection.execute(
+                'SELECT status, COUNT(*), SUM(weight) FROM units GROUP BY status'):
+            counts[status] = count
+            weights[status] = weight
+
+        elapsed = None if self._started_at is None else time() - self._started_at
+
+        eta = None
+        if elapsed and self._weight_done:
+            eta = weights['pending'] / (self._weight_done / elapsed)
+
+        return {
+            'total': sum(counts.values()),
+            'pending': counts['pending'],
+            'done': counts['done'],
+            'failed': counts['failed'],
+            'weight_total': sum(weights.values()),
+            'weight_done': weights['done'],
+            'elapsed_seconds': elapsed,
+            'eta_seconds': eta
+        }
+
+    def failed(self):
+        """
+        :return: list of (client_customer_id, spec, start date, end date, error) of failed units
+        """
+
+        return list(self._connection.execute(
+            'SELECT client_customer_id, spec, start_date, end_date, error FROM units WHERE status = ? ORDER BY id',
+            ('failed',)
+        ))
+
+    def retry_failed(self):
+        """
+        Set failed units pending again with their attempts reset.
+
+        :return: number of units reset
+        """
+
+        with self._connection:
+            return self._connection.execute(
+                'UPDATE units SET status = ?, attempts = 0 WHERE status = ?',
+                ('pending', 'failed')
+            ).rowcount
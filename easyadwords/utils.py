@@ -1,5 +1,42 @@
-from suds.sudsobject import asdict
+from suds.sudsobject import Object
 from datetime import datetime, timedelta
+from Queue import Queue, Full
+from threading import Thread, Event
+import sys
+import zlib
+
+
+def _encode(value):
+    return value.encode('utf-8')
+
+
+def _identity(value):
+    return value
+
+
+def _serialize_list(values):
+    return [serialize_soap_resp(item) if isinstance(item, Object) else item for item in values]
+
+
+# serializer per value type, resolved once per type instead of probing every value
+_SERIALIZERS = {}
+
+
+def _serializer_for(value_type):
+    try:
+        return _SERIALIZERS[value_type]
+    except KeyError:
+        if issubclass(value_type, Object):
+            serializer = serialize_soap_resp
+        elif issubclass(value_type, list):
+            serializer = _serialize_list
+        elif issubclass(value_type, unicode):
+            serializer = _encode
+        else:
+            serializer = _identity
+
+        _SERIALIZERS[value_type] = serializer
+        return serializer
 
 
 def serialize_soap_resp(resp):
@@ -10,25 +47,90 @@ def serialize_soap_resp(resp):
     :return: Dictionary representation of response
     """
     out = {}
-    for k, v in asdict(resp).iteritems():
-        if hasattr(v, '__keylist__'):
-            out[k] = serialize_soap_resp(v)
-        elif isinstance(v, list):
-            out[k] = []
-            for item in v:
-                if hasattr(item, '__keylist__'):
-                    out[k].append(serialize_soap_resp(item))
-                else:
-                    out[k].append(item)
-        else:
-            try:
-                out[k] = v.encode('utf-8')
-            except AttributeError:
-                out[k] = v
+    values = resp.__dict__
+
+    for k in resp.__keylist__:
+        if k in values:
+            v = values[k]
+            out[k] = _serializer_for(type(v))(v)
 
     return out
 
 
+def _lazy_value(value):
+    serializer = _serializer_for(type(value))
+
+    if serializer is serialize_soap_resp:
+        return LazyRecord(value)
+    elif serializer is _serialize_list:
+        return [LazyRecord(item) if isinstance(item, Object) else item for item in value]
+    else:
+        return serializer(value)
+
+
+class LazyRecord(object):
+    """
+    Read-only, dict-like view of a SOAP response that only converts fields when they are accessed.
+
+    Fields can be accessed as keys or attributes. Nested objects are returned as LazyRecord, values are converted the
+    same way as serialize_soap_resp. Use to_dict for a fully serialized copy.
+    """
+
+    __slots__ = ('_resp', '_cache')
+
+    def __init__(self, resp):
+        self._resp = resp
+        self._cache = None
+
+    def __getitem__(self, key):
+        cache = self._cache
+        if cache is None:
+            cache = self._cache = {}
+        elif key in cache:
+            return cache[key]
+
+        values = self._resp.__dict__
+        if key not in values or key not in self._resp.__keylist__:
+            raise KeyError(key)
+
+        value = cache[key] = _lazy_value(values[key])
+        return value
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, key):
+        return key in self._resp.__keylist__ and key in self._resp.__dict__
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return 'LazyRecord(%r)' % self.to_dict()
+
+    def keys(self):
+        values = self._resp.__dict__
+        return [k for k in self._resp.__keylist__ if k in values]
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        return serialize_soap_resp(self._resp)
+
+
 def date_range(start, end, ascending=True, date_format='%Y-%m-%d'):
     """
     Simple datetime generator for dates between start and end (inclusive).
@@ -58,3 +160,218 @@ def date_range(start, end, ascending=True, date_format='%Y-%m-%d'):
 
     for i in (range(0, days_apart) if ascending else range(0, days_apart)[::-1]):
         yield start_date + timedelta(i)
+
+
+def date_windows(start, end, days, date_format='%Y-%m-%d'):
+    """
+    Split dates between start and end (inclusive) into consecutive windows of at most days days.
+
+    :param start: Date to start at.
+    :type start: datetime object or string representation of datetime.
+    :param end: Date to stop at.
+    :type end: datetime object or string representation of datetime.
+    :param days: Maximum days per window.
+    :param date_format: If input is string, denotes string datetime format to convert from.
+    :return: generator object for (window start, window end) tuples of naive datetime objects
+    """
+    assert days >= 1
+
+    window = []
+    for date in date_range(start, end, date_format=date_format):
+        window.append(date)
+
+        if len(window) == days:
+            yield window[0], window[-1]
+            window = []
+
+    if window:
+        yield window[0], window[-1]
+
+
+class TruncatedGzipError(IOError):
+    """
+    Gzipped stream ended in the middle of a member, eg. a download cut short.
+    """
+
+
+def iter_decompressed(stream, chunk_size=1024 * 16):
+    """
+    Incrementally decompress a gzipped stream.
+
+    Compressed data is read in chunk_size pieces and each decompressed piece is capped at chunk_size bytes,
+    so memory stays bounded regardless of the size of the stream. Concatenated gzip members are supported.
+
+    :param stream: File-like object returning gzipped bytes from read(size).
+    :param chunk_size: Maximum number of bytes read from stream and yielded per chunk.
+    :raises TruncatedGzipError: if the stream ends before the trailer of its last member.
+    :return: generator object for decompressed byte chunks
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    received = False
+
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+        received = True
+
+        while data:
+            chunk = decompressor.decompress(data, chunk_size)
+            if chunk:
+                yield chunk
+
+            tail = decompressor.unconsumed_tail
+
+            # a finished member leaves the rest of the input in unused_data, or in unconsumed_tail with no
+            # progress made when max_length was reached at the same time. either way it starts the next member.
+            if decompressor.unused_data or (tail and not chunk and len(tail) == len(data)):
+                data = decompressor.unused_data or tail
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                data = tail
+
+    # output still held back by max_length, without ending the stream as flush would
+    while True:
+        chunk = decompressor.decompress(b'', chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+    # zlib only hands back input as unused_data once a member is complete, including its CRC32 and ISIZE trailer,
+    # which zlib checks. a byte fed to an unfinished member is consumed instead.
+    if received and (decompressor.decompress(b'\x00') or decompressor.unused_data != b'\x00'):
+        raise TruncatedGzipError('Gzipped stream ended before the end of the last member')
+
+
+def copy_gzip(stream, sink, chunk_size=1024 * 16, decompressed=None):
+    """
+    Copy a gzipped stream to sink as is, decompressing it on the way to check it is complete.
+
+    :param stream: File-like object returning gzipped bytes from read(size).
+    :param sink: File-like object to write gzipped bytes to, or None.
+    :param decompressed: File-like object to write decompressed bytes to, so the stream is only decompressed once.
+    :raises TruncatedGzipError: if the stream ends before the trailer of its last member.
+    :return: number of gzipped bytes read
+    """
+
+    class _Tee(object):
+        size = 0
+
+        def read(self, size):
+            data = stream.read(size)
+            if sink is not None:
+                sink.write(data)
+            self.size += len(data)
+            return data
+
+    tee = _Tee()
+    for chunk in iter_decompressed(tee, chunk_size):
+        if decompressed is not None:
+            decompressed.write(chunk)
+
+    return tee.size
+
+
+def iter_lines(chunks):
+    """
+    Split an iterable of byte chunks into lines, keeping line endings.
+
+    :param chunks: Iterable of byte strings, e.g. output of iter_decompressed.
+    :return: generator object for lines
+    """
+    pending = b''
+
+    for chunk in chunks:
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+
+        for line in lines:
+            yield line + b'\n'
+
+    if pending:
+        yield pending
+
+
+def iter_record_blocks(chunks, block_size=1024 * 1024):
+    """
+    Regroup an iterable of csv byte chunks into blocks of whole records.
+
+    Blocks are cut after the last line ending of at least block_size bytes that is not inside a quoted field, so each
+    block can be parsed on its own.
+
+    :param chunks: Iterable of byte strings, e.g. output of iter_decompressed.
+    :param block_size: Minimum bytes per block, except the last one.
+    :return: generator object for blocks
+    """
+    pending = b''
+
+    for chunk in chunks:
+        pending += chunk
+        if len(pending) < block_size:
+            continue
+
+        # an even number of quotes before a line ending means it is not inside a quoted field
+        end = pending.rfind(b'\n')
+        while end >= 0 and pending.count(b'"', 0, end) % 2:
+            end = pending.rfind(b'\n', 0, end)
+
+        if end >= 0:
+            yield pending[:end + 1]
+            pending = pending[end + 1:]
+
+    if pending:
+        yield pending
+
+
+def prefetch(iterable, depth=1):
+    """
+    Consume iterable on a background thread, keeping up to depth items ready ahead of the caller.
+
+    Exceptions raised by iterable are re-raised in the caller. Closing the returned generator stops the background
+    thread after the item it is currently producing.
+
+    :param iterable: Iterable to consume, eg. generator making network requests.
+    :param depth: Maximum number of items buffered ahead of the caller.
+    :return: generator object for items of iterable
+    """
+    assert depth >= 1
+
+    queue = Queue(maxsize=depth)
+    stopped = Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except Exception:
+            put((done, sys.exc_info()))
+        else:
+            put((done, None))
+
+    thread = Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+
+    try:
+        while True:
+            item, exc_info = queue.get()
+
+            if item is done:
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                return
+
+            yield item
+    finally:
+        stopped.set()
@@ -0,0 +1,387 @@
+import json
+import mmap
+import struct
+from array import array
+from datetime import date, datetime
+
+import unicodecsv as csv
+
+from easyadwords.cleaning import RowCleaner
+from easyadwords.columnar import ColumnarTable, NumericColumn, DictionaryColumn, np
+
+MAGIC = b'EAWCOL02'
+
+# files with pickled dictionaries, no longer read
+_PICKLED_MAGIC = b'EAWCOL01'
+
+# footer length and magic close the file, the footer is JSON describing where each column chunk is and holding the
+# dictionaries of dictionary encoded columns
+_TRAILER = struct.Struct('<Q8s')
+_ALIGNMENT = 8
+
+_JSON_TYPES = (basestring, bool, int, long, float)
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+_DATE_FORMAT = '%Y-%m-%d'
+
+
+def _encode_dictionary(name, dictionary):
+    # tag the values of a column that JSON can not hold, dates and datetimes are stored as strings
+    if dictionary and all(isinstance(x, datetime) and x.tzinfo is None for x in dictionary):
+        return 'datetime', [x.strftime(_DATETIME_FORMAT) for x in dictionary]
+
+    if dictionary and all(isinstance(x, date) and not isinstance(x, datetime) for x in dictionary):
+        return 'date', [x.strftime(_DATE_FORMAT) for x in dictionary]
+
+    for value in dictionary:
+        if not isinstance(value, _JSON_TYPES):
+            raise TypeError('Column %s: can not write %r to a columnar file, columns hold strings, numbers, naive '
+                            'datetimes or dates' % (name, value))
+
+    return 'json', dictionary
+
+
+def _decode_dictionary(value_type, values):
+    if value_type == 'datetime':
+        return [datetime.strptime(x, _DATETIME_FORMAT) for x in values]
+    elif value_type == 'date':
+        return [datetime.strptime(x, _DATE_FORMAT).date() for x in values]
+    else:
+        return values
+
+
+def write_csv(report, sink, batch_size=10000, encoding='utf-8'):
+    """
+    Write a report, eg. the generator from get_report with its header first, as csv in batches of rows.
+
+    :param report: Iterable of rows.
+    :param sink: Path to write to, or file opened in binary mode.
+    :param batch_size: Rows held in memory per writerows call.
+    :param encoding: Encoding of unicode values.
+    :return: number of rows written, including header
+    """
+
+    if isinstance(sink, basestring):
+        with open(sink, 'wb', 1024 * 1024) as f:
+            return write_csv(report, f, batch_size, encoding)
+
+    writer = csv.writer(sink, encoding=encoding)
+    count = 0
+    batch = []
+
+    for row in report:
+        batch.append(row)
+
+        if len(batch) == batch_size:
+            writer.writerows(batch)
+            count += len(batch)
+            batch = []
+
+    if batch:
+        writer.writerows(batch)
+        count += len(batch)
+
+    return count
+
+
+class ColumnarWriter(object):
+    """
+    Writes rows to a binary columnar file, read back with ColumnarFile.
+
+    Rows are buffered into typed columns (see easyadwords.columnar) and flushed every batch_size rows, so memory is
+    bounded by batch_size plus the distinct values of dictionary encoded columns. Each flush writes the raw bytes of
+    every column, 8 byte aligned. Dictionaries are shared by all batches and written as JSON into the footer on close,
+    so dictionary encoded columns may hold strings, numbers, naive datetimes or dates, one kind of date per column.
+    """
+
+    def __init__(self, path, header, types, batch_size=65536):
+        """
+        :param path: File to write.
+        :param header: Column names.
+        :param types: Adwords field type per column, None for untyped columns.
+        :param batch_size: Rows buffered before being written.
+        """
+
+        self.path = path
+        self.batch_size = batch_size
+
+        self._table = ColumnarTable(header, types)
+        self._appends = [x.append for x in self._table.columns]
+        self._buffered = 0
+        self.rows = 0
+        self._chunks = [[] for _ in self._table.columns]
+
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+
+    def _write_array(self, values):
+        # align so arrays can be viewed in place from a memory map
+        padding = -self._file.tell() % _ALIGNMENT
+        if padding:
+            self._file.write(b'\x00' * padding)
+
+        offset = self._file.tell()
+        self._file.write(values.tostring() if isinstance(values, array) else bytes(values))
+        return offset
+
+    def _flush(self):
+        if not self._buffered:
+            return
+
+        for column, chunks in zip(self._table.columns, self._chunks):
+            if isinstance(column, NumericColumn):
+                chunk = {'values': self._write_array(column.values)}
+                if column.mask is not None:
+                    chunk['mask'] = self._write_array(column.mask)
+
+                # columns are reused for the next batch
+                column.values = array(column.typecode)
+                column.mask = None
+            else:
+                chunk = {'codes': self._write_array(column.codes)}
+                column.codes = array(column.codes.typecode)
+
+            chunk['rows'] = self._buffered
+            chunks.append(chunk)
+
+        self.rows += self._buffered
+        self._buffered = 0
+        self._appends = [x.append for x in self._table.columns]
+
+    def write_rows(self, rows):
+        """
+        :param rows: Iterable of cleaned rows without header.
+        """
+
+        appends = self._appends
+        batch_size = self.batch_size
+
+        for row in rows:
+            for append, value in zip(appends, row):
+                append(value)
+
+            self._buffered += 1
+            if self._buffered == batch_size:
+                self._flush()
+                appends = self._appends
+
+    def close(self):
+        """
+        Flush buffered rows and write the footer.
+        """
+
+        try:
+            self._flush()
+
+            columns = []
+            for name, column, chunks in zip(self._table.header, self._table.columns, self._chunks):
+                if isinstance(column, NumericColumn):
+                    columns.append({
+                        'kind': 'numeric',
+                        'typecode': column.typecode,
+                        'itemsize': column.values.itemsize,
+                        'chunks': chunks
+                    })
+                else:
+                    value_type, dictionary = _encode_dictionary(name, column.dictionary)
+                    columns.append({
+                        'kind': 'dictionary',
+                        'itemsize': column.codes.itemsize,
+                        'value_type': value_type,
+                        'dictionary': dictionary,
+                        'chunks': chunks
+                    })
+
+            footer = json.dumps({
+                'header': self._table.header,
+                'types': self._table.types,
+                'rows': self.rows,
+                'columns': columns
+            })
+
+            self._file.write(footer)
+            self._file.write(_TRAILER.pack(len(footer), MAGIC))
+        finally:
+            self._file.close()
+
+
+def write_columnar(report, path, fields, additional_fields=None, batch_size=65536):
+    """
+    Write the generator from get_report to a binary columnar file, read back with ColumnarFile or read_columnar.
+
+    Columns are typed as in get_report_columnar, from the Adwords type of each field. If a field has custom cleaning,
+    set its 'type' to match the cleaned values.
+
+    :param report: Generator from get_report, header first.
+    :param path: File to write.
+    :param fields: Fields passed to get_report.
+    :param additional_fields: Additional fields passed to get_report.
+    :param batch_size: Rows buffered before being written.
+    :return: number of rows written, excluding header
+    """
+
+    # field types are filled in once the header is out
+    header = next(report)
+    types = RowCleaner(fields, additional_fields or []).types
+
+    writer = ColumnarWriter(path, header, types, batch_size)
+    with writer:
+        writer.write_rows(report)
+
+    return writer.rows
+
+
+class ColumnarFile(object):
+    """
+    Memory mapped binary columnar file written by ColumnarWriter.
+
+    read returns a ColumnarTable, copying column bytes out of the map without parsing values. to_numpy returns arrays
+    viewing the map directly where a column was written in a single batch.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        footer_length, magic = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+        assert magic != _PICKLED_MAGIC, '%s was written by an older version of easyadwords, write it again' % path
+        assert magic == MAGIC and self._map[:len(MAGIC)] == MAGIC, '%s is not a columnar report file' % path
+
+        footer_offset = len(self._map) - _TRAILER.size - footer_length
+        footer = json.loads(self._map[footer_offset:footer_offset + footer_length])
+
+        self.header = footer['header']
+        self.types = footer['types']
+        self.rows = footer['rows']
+        self._columns = footer['columns']
+
+    def __len__(self):
+        return self.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def _array(self, typecode, offset, count):
+        values = array(typecode)
+        values.fromstring(self._map[offset:offset + count * values.itemsize])
+        return values
+
+    def _typecode(self, column):
+        if column['kind'] == 'dictionary':
+            typecode = 'i'
+        else:
+            typecode = column['typecode']
+
+        assert array(typecode).itemsize == column['itemsize'], 'file was written on a platform with other array sizes'
+        return typecode
+
+    @staticmethod
+    def _dictionary(column):
+        return _decode_dictionary(column['value_type'], column['dictionary'])
+
+    def _mask(self, column):
+        if not any('mask' in x for x in column['chunks']):
+            return None
+
+        mask = bytearray()
+        for chunk in column['chunks']:
+            if 'mask' in chunk:
+                mask.extend(self._map[chunk['mask']:chunk['mask'] + chunk['rows']])
+            else:
+                mask.extend(b'\x01' * chunk['rows'])
+        return mask
+
+    def read_column(self, name):
+        """
+        :return: NumericColumn or DictionaryColumn
+        """
+
+        column = self._columns[self.header.index(name)]
+        typecode = self._typecode(column)
+
+        values = array(typecode)
+        for chunk in column['chunks']:
+            offset = chunk['values' if column['kind'] == 'numeric' else 'codes']
+            values.extend(self._array(typecode, offset, chunk['rows']))
+
+        if column['kind'] == 'numeric':
+            return NumericColumn(typecode, values, self._mask(column))
+        else:
+            return DictionaryColumn(values, self._dictionary(column))
+
+    def read(self):
+        """
+        :return: ColumnarTable
+        """
+
+        return ColumnarTable(self.header, self.types, [self.read_column(x) for x in self.header])
+
+    def to_numpy(self):
+        """
+        Requires numpy.
+
+        **NOTE** Arrays may view the memory map, keep the file open while using them.
+
+        :return: dictionary of column name to numpy array, masked array for numeric columns containing None
+        """
+
+        assert np is not None, 'numpy is not installed'
+
+        arrays = {}
+        for name, column in zip(self.header, self._columns):
+            typecode = self._typecode(column)
+
+            if column['kind'] == 'numeric':
+                dtype = 'f8' if typecode == 'd' else 'i%d' % column['itemsize']
+                key = 'values'
+            else:
+                dtype = 'i%d' % column['itemsize']
+                key = 'codes'
+
+            parts = [np.frombuffer(self._map, dtype, x['rows'], x[key]) for x in column['chunks']]
+            values = parts[0] if len(parts) == 1 else np.concatenate(parts) if parts else np.empty(0, dtype)
+
+            if column['kind'] == 'numeric':
+                mask = self._mask(column)
+                if mask is not None:
+                    values = np.ma.masked_array(values, mask=np.frombuffer(mask, dtype='u1') == 0)
+            else:
+                dictionary = self._dictionary(column)
+                lookup = np.empty(len(dictionary) + 1, dtype=object)
+                lookup[:-1] = dictionary
+                lookup[-1] = None
+
+                # code -1 indexes the trailing None
+                values = lookup[values]
+
+            arrays[name] = values
+
+        return arrays
+
+
+def read_columnar(path):
+    """
+    Load a binary columnar file written by ColumnarWriter or write_columnar.
+
+    :return: ColumnarTable
+    """
+
+    with ColumnarFile(path) as f:
+        return f.read()
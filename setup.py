@@ -19,7 +19,7 @@ setup(
     author="Daniel Poon",
     author_email='daniel.poon.wenjie@gmail.com',
     url='https://github.com/danielpoonwj/easyadwords',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data=True,
     install_requires=requirements,
     license="Apache Software License 2.0",